@@ -0,0 +1,217 @@
+import collections
+import email.utils
+import hashlib
+import logging
+import time
+
+from fastapi import Request, Response
+
+logger = logging.getLogger(__name__)
+
+
+# Serialized JSON responses keyed by resource, e.g. "items:1". Routers fill
+# the cache on read and delete the key from every path that changes the row.
+# Entries also expire after `ttl` seconds, which bounds how long a response
+# filled concurrently with an update can stay stale. The memory backend only
+# deletes the key in the worker that made the change, the other workers keep
+# their copy until it expires, so its TTL is kept short.
+#
+# A shared backend also keeps a version per table, the time of its last write
+# in microseconds, which list endpoints turn into ETag and Last-Modified.
+class MemoryCache:
+    def __init__(self, max_size: int = 10_000, ttl: int = 2):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: collections.OrderedDict[str, tuple[float, bytes]] = (
+            collections.OrderedDict()
+        )
+
+    async def get(self, key: str) -> bytes | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: bytes):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def delete(self, *keys: str):
+        for key in keys:
+            self._entries.pop(key, None)
+
+    # Writes made by other workers are not seen here, a version kept per
+    # worker would answer 304 for a list another worker changed. Lists get
+    # no validators with this backend.
+    async def get_version(self, table: str) -> int | None:
+        return None
+
+    async def bump_version(self, table: str):
+        pass
+
+
+# Shared between workers and processes. Needs the redis package; errors are
+# logged and treated as a miss so an unavailable server only costs the
+# database read.
+class RedisCache:
+    def __init__(self, url: str, ttl: int = 300):
+        import redis.asyncio
+
+        self.ttl = ttl
+        self._client = redis.asyncio.Redis.from_url(url)
+
+    async def get(self, key: str) -> bytes | None:
+        try:
+            return await self._client.get(key)
+        except Exception as e:
+            logger.warning(f"Cache get failed: {e}")
+            return None
+
+    async def set(self, key: str, value: bytes):
+        try:
+            await self._client.set(key, value, ex=self.ttl)
+        except Exception as e:
+            logger.warning(f"Cache set failed: {e}")
+
+    async def delete(self, *keys: str):
+        try:
+            await self._client.delete(*keys)
+        except Exception as e:
+            logger.warning(f"Cache delete failed: {e}")
+
+    async def get_version(self, table: str) -> int | None:
+        key = f"version:{table}"
+        try:
+            version = await self._client.get(key)
+            if version is None:
+                # First reader starts the clock for a table never written
+                await self._client.set(key, time.time_ns() // 1000, nx=True)
+                version = await self._client.get(key)
+            return int(version)
+        except Exception as e:
+            logger.warning(f"Cache get version failed: {e}")
+            return None
+
+    async def bump_version(self, table: str):
+        try:
+            await self._client.set(f"version:{table}", time.time_ns() // 1000)
+        except Exception as e:
+            logger.warning(f"Cache bump version failed: {e}")
+
+    async def close(self):
+        await self._client.aclose()
+
+
+class NullCache:
+    async def get(self, key: str) -> bytes | None:
+        return None
+
+    async def set(self, key: str, value: bytes):
+        pass
+
+    async def delete(self, *keys: str):
+        pass
+
+    async def get_version(self, table: str) -> int | None:
+        return None
+
+    async def bump_version(self, table: str):
+        pass
+
+
+def etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def is_not_modified(request: Request, tag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return tag in (
+        value.strip().removeprefix("W/") for value in if_none_match.split(",")
+    )
+
+
+async def list_headers(request: Request, model, cache_control: str) -> dict:
+    # Read the version before the rows, so a write that lands in between
+    # leaves an older ETag on newer data and the next request gets a 200
+    table = model.__tablename__
+    headers = {"Cache-Control": cache_control}
+    version = await backend.get_version(table)
+    if version is not None:
+        headers["ETag"] = etag(f"{table}:{version}:{request.url.query}".encode())
+        headers["Last-Modified"] = email.utils.formatdate(
+            version / 1_000_000, usegmt=True
+        )
+    return headers
+
+
+def is_fresh(request: Request, headers: dict) -> bool:
+    if "ETag" not in headers:
+        return False
+    if "if-none-match" in request.headers:
+        return is_not_modified(request, headers["ETag"])
+
+    # HTTP dates have one-second resolution, a write in the same second as
+    # the previous one is only told apart by the ETag
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if not if_modified_since:
+        return False
+    try:
+        since = email.utils.parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    modified = email.utils.parsedate_to_datetime(headers["Last-Modified"])
+    return since.tzinfo is not None and modified <= since
+
+
+def not_modified(headers: dict) -> Response:
+    return Response(status_code=304, headers=headers)
+
+
+async def touch(*models):
+    for model in models:
+        await backend.bump_version(model.__tablename__)
+
+
+def json_response(request: Request, body: bytes) -> Response:
+    tag = etag(body)
+    if is_not_modified(request, tag):
+        return Response(status_code=304, headers={"ETag": tag})
+    return Response(content=body, media_type="application/json", headers={"ETag": tag})
+
+
+backend = MemoryCache()
+
+
+def init_cache(settings):
+    global backend
+
+    if settings.CACHE_BACKEND == "redis":
+        backend = RedisCache(settings.CACHE_URL, ttl=settings.CACHE_TTL_SECONDS)
+    elif (
+        settings.CACHE_BACKEND == "memory" and settings.CACHE_MEMORY_TTL_SECONDS > 0
+    ):
+        backend = MemoryCache(
+            max_size=settings.CACHE_MAX_SIZE,
+            ttl=settings.CACHE_MEMORY_TTL_SECONDS,
+        )
+    else:
+        backend = NullCache()
+
+
+async def close_cache():
+    if isinstance(backend, RedisCache):
+        await backend.close()
@@ -5,13 +5,107 @@ class Settings(BaseSettings):
     SQLDB_URL: str
     SECRET_KEY: str = "secret"
 
+    # Server started by digimon.run. auto picks uvloop and httptools when
+    # they are installed, asyncio and h11 otherwise.
+    HOST: str = "127.0.0.1"
+    PORT: int = 8000
+    EVENT_LOOP: str = "auto"  # auto, asyncio or uvloop
+    HTTP_PARSER: str = "auto"  # auto, h11 or httptools
+
+    # Workers started by `digimon serve`. gunicorn needs the gunicorn extra,
+    # auto uses it when installed and uvicorn's own supervisor otherwise.
+    WEB_SERVER: str = "auto"  # auto, gunicorn or uvicorn
+    WEB_WORKERS: int = 0  # 0 starts one per CPU
+    WEB_PRELOAD: bool = True  # gunicorn imports the app once before forking
+    WEB_KEEPALIVE_SECONDS: int = 5  # keep above the load balancer idle timeout
+    WEB_GRACEFUL_TIMEOUT_SECONDS: int = 30  # to finish requests on stop/reload
+    WEB_MAX_REQUESTS: int = 0  # requests before a worker is replaced, 0 never
+
+    DB_ECHO: bool = False
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 10
+    # Connections all `digimon serve` workers may open together, split into
+    # DB_POOL_SIZE and DB_MAX_OVERFLOW per worker. 0 uses those as they are.
+    DB_CONNECTION_BUDGET: int = 0
+    DB_POOL_TIMEOUT: float = 30  # seconds to wait for a free connection
+    DB_POOL_RECYCLE: int = 30 * 60  # 30 minutes, -1 never recycles
+    DB_POOL_PRE_PING: bool = True
+    DB_POOL_WARMUP: bool = True  # open DB_POOL_SIZE connections on startup
+    DB_STATEMENT_CACHE_SIZE: int = 500  # compiled SQL cache per engine
+    DB_PREPARED_STATEMENT_CACHE_SIZE: int = 500  # asyncpg, per connection
+    # Statements per request, their total and slowest time in a Server-Timing
+    # header, and a warning for each statement slower than DB_SLOW_QUERY_MS
+    DB_SERVER_TIMING: bool = False
+    DB_SLOW_QUERY_MS: float = 0  # 0 disables the slow query log
+
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 5 * 60  # 5 minutes
     REFRESH_TOKEN_EXPIRE_MINUTES: int = 7 * 24 * 60  # 7 days
 
+    # Put roles, status and a token version in access tokens so auth needs no
+    # database access
+    AUTH_STATELESS_TOKENS: bool = False
+    AUTH_CACHE_SIZE: int = 10_000  # verified tokens kept per worker, 0 disables
+    # Also the revocation window: another worker may accept a token for this
+    # long after a password or role change, until it reads the user again
+    AUTH_CACHE_TTL_SECONDS: int = 60
+
+    PASSWORD_HASH_EXECUTOR: str = "thread"  # thread or process
+    PASSWORD_HASH_WORKERS: int = 4
+    PASSWORD_HASH_MAX_QUEUE: int = 256  # 0 never rejects
+
+    COUNT_CACHE_TTL_SECONDS: int = 30  # 0 runs COUNT(*) on every list request
+    COUNT_USE_ESTIMATE: bool = False  # use pg_class.reltuples on PostgreSQL
+
+    LOGIN_FLUSH_INTERVAL_SECONDS: float = 5  # last_login_date write-behind
+    LOGIN_BUFFER_SIZE: int = 10_000  # users waiting for a flush per worker
+
+    # Item and merchant detail responses. memory is per worker, redis is
+    # shared and needs the redis extra, none disables the cache.
+    CACHE_BACKEND: str = "memory"
+    CACHE_URL: str = "redis://localhost:6379/0"
+    # Entries expire after CACHE_TTL_SECONDS with redis. The memory backend
+    # uses CACHE_MEMORY_TTL_SECONDS, the longest other workers can return an
+    # item or merchant as it was before an update, or after it was deleted.
+    CACHE_TTL_SECONDS: int = 300
+    CACHE_MEMORY_TTL_SECONDS: int = 2
+    CACHE_MAX_SIZE: int = 10_000  # memory backend entries per worker
+
+    # Cache-Control of the list endpoints. no-cache lets clients keep a copy
+    # but revalidate it, which the ETag turns into a 304 when nothing changed.
+    # Lists only get an ETag with the redis backend, which all workers share.
+    CACHE_CONTROL_ITEMS: str = "public, no-cache"
+    CACHE_CONTROL_MERCHANTS: str = "public, no-cache"
+    CACHE_CONTROL_TRANSACTIONS: str = "private, no-cache"
+
+    # Render responses with pydantic-core and serialize list pages in one pass
+    FAST_JSON_RESPONSES: bool = False
+
+    # Request latency, in-flight requests, DB pool, bcrypt pool and auth cache
+    # in Prometheus text format at METRICS_PATH, per worker process. Disabled
+    # adds nothing to the request path.
+    METRICS_ENABLED: bool = False
+    METRICS_PATH: str = "/metrics"
+
     model_config = SettingsConfigDict(
         env_file=".env", validate_assignment=True, extra="allow"
     )
 
 
+settings = None
+
+
+# One instance per process, read when it is first needed. create_app
+# registers the settings it was given, so modules that read them per request
+# see the same values.
 def get_settings():
-    return Settings()
+    global settings
+
+    if settings is None:
+        settings = Settings()
+    return settings
+
+
+def init_settings(new_settings):
+    global settings
+
+    settings = new_settings
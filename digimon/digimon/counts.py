@@ -0,0 +1,76 @@
+import time
+
+from sqlalchemy import text
+from sqlmodel import select, func
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+
+# Row counts cached per table for `ttl` seconds and adjusted by the create and
+# delete paths. The cache is per worker process, so writes made by other
+# workers show up once the entry expires.
+class CountProvider:
+    def __init__(self, ttl: int = 30, use_estimate: bool = False):
+        self.ttl = ttl
+        self.use_estimate = use_estimate
+        self._counts: dict[str, tuple[int, float]] = {}
+
+    async def count(self, session: AsyncSession, model, exact: bool = False) -> int:
+        table = model.__tablename__
+
+        if not exact and self.ttl > 0:
+            cached = self._counts.get(table)
+            if cached and cached[1] > time.monotonic():
+                return cached[0]
+
+        total = None
+        if not exact and self.use_estimate:
+            total = await self._estimate(session, table)
+        if total is None:
+            result = await session.exec(select(func.count()).select_from(model))
+            total = result.one()
+
+        if self.ttl > 0:
+            self._counts[table] = (total, time.monotonic() + self.ttl)
+        return total
+
+    def add(self, model, delta: int = 1):
+        table = model.__tablename__
+        cached = self._counts.get(table)
+        if cached:
+            self._counts[table] = (max(cached[0] + delta, 0), cached[1])
+
+    def invalidate(self, model=None):
+        if model is None:
+            self._counts.clear()
+        else:
+            self._counts.pop(model.__tablename__, None)
+
+    async def _estimate(self, session: AsyncSession, table: str) -> int | None:
+        if session.get_bind().dialect.name != "postgresql":
+            return None
+
+        result = await session.execute(
+            text(
+                "SELECT reltuples::bigint FROM pg_class "
+                "WHERE oid = to_regclass(:table)"
+            ),
+            dict(table=table),
+        )
+        estimate = result.scalar_one_or_none()
+
+        # reltuples is -1 until the table has been vacuumed or analyzed
+        if estimate is None or estimate < 0:
+            return None
+        return int(estimate)
+
+
+provider = CountProvider()
+
+
+def init_counts(settings):
+    global provider
+
+    provider = CountProvider(
+        ttl=settings.COUNT_CACHE_TTL_SECONDS,
+        use_estimate=settings.COUNT_USE_ESTIMATE,
+    )
@@ -1,5 +1,6 @@
 from fastapi import Depends, HTTPException, status, Path, Query
 from fastapi.security import OAuth2PasswordBearer
+import logging
 import typing
 import jwt
 from pydantic import ValidationError
@@ -7,37 +8,113 @@ from pydantic import ValidationError
 from . import models
 from . import security
 from . import config
+from . import token_cache
+
+logger = logging.getLogger(__name__)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/token")
-settings = config.get_settings()
 
-async def get_current_user(
-    token: typing.Annotated[str, Depends(oauth2_scheme)],
-    session: typing.Annotated[models.AsyncSession, Depends(models.get_session)],
-) -> models.User:
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+credentials_exception = HTTPException(
+    status_code=status.HTTP_401_UNAUTHORIZED,
+    detail="Could not validate credentials",
+    headers={"WWW-Authenticate": "Bearer"},
+)
+
+def decode_token(token: str) -> dict:
+    settings = config.get_settings()
     try:
         payload = jwt.decode(
             token, settings.SECRET_KEY, algorithms=[security.ALGORITHM]
         )
-        user_id: int = payload.get("sub")
+        payload["sub"] = int(payload["sub"])
 
-        if user_id is None:
-            raise credentials_exception
+    except (jwt.PyJWTError, KeyError, TypeError, ValueError) as e:
+        logger.debug(f"Invalid token: {e}")
+        raise credentials_exception
+
+    # Refresh tokens are only accepted by /token/refresh
+    if payload.get("typ", security.ACCESS_TOKEN) != security.ACCESS_TOKEN:
+        raise credentials_exception
 
-    except jwt.JWTError as e:
-        print(e)
+    if "ver" in payload and security.is_token_revoked(payload["sub"], payload["ver"]):
         raise credentials_exception
 
-    user = await session.get(models.DBUser, user_id)
+    return payload
+
+def get_cached_user(token: str) -> models.User | None:
+    cached = token_cache.cache.get(token)
+    if cached is None:
+        return None
+
+    payload, current_user = cached
+    if "ver" in payload and security.is_token_revoked(current_user.id, payload["ver"]):
+        raise credentials_exception
+    return current_user
+
+async def load_user(
+    token: str, payload: dict, session: models.AsyncSession
+) -> models.User:
+    user = await session.get(models.DBUser, payload["sub"])
     if user is None:
         raise credentials_exception
 
-    return user
+    security.record_token_version(user.id, user.token_version)
+    if payload.get("ver", user.token_version) < user.token_version:
+        raise credentials_exception
+
+    current_user = models.User.model_validate(user)
+    token_cache.cache.set(
+        token, current_user.id, (payload, current_user), token_exp=payload.get("exp")
+    )
+    return current_user
+
+async def get_current_user(
+    token: typing.Annotated[str, Depends(oauth2_scheme)],
+    session: typing.Annotated[models.AsyncSession, Depends(models.get_session)],
+) -> models.User:
+    current_user = get_cached_user(token)
+    if current_user is not None:
+        return current_user
+
+    return await load_user(token, decode_token(token), session)
+
+async def get_current_principal(
+    token: typing.Annotated[str, Depends(oauth2_scheme)],
+    session: typing.Annotated[models.AsyncSession, Depends(models.get_session)],
+) -> models.Principal:
+    current_user = get_cached_user(token)
+    if current_user is not None:
+        return models.Principal.model_validate(current_user)
+
+    # Stateless tokens carry everything a principal needs. Only the user's
+    # token version is read again, at most once per AUTH_CACHE_TTL_SECONDS,
+    # so a change made through another worker revokes the token here too.
+    payload = decode_token(token)
+    if "roles" in payload and "status" in payload and "ver" in payload:
+        ttl = config.get_settings().AUTH_CACHE_TTL_SECONDS
+        if security.version_check_due(payload["sub"], ttl):
+            result = await session.exec(
+                models.select(models.DBUser.token_version).where(
+                    models.DBUser.id == payload["sub"]
+                )
+            )
+            token_version = result.one_or_none()
+            if token_version is None:
+                raise credentials_exception
+
+            security.record_token_version(payload["sub"], token_version)
+            if payload["ver"] < token_version:
+                raise credentials_exception
+
+        return models.Principal(
+            id=payload["sub"],
+            roles=payload["roles"],
+            status=payload["status"],
+            token_version=payload["ver"],
+        )
+
+    current_user = await load_user(token, payload, session)
+    return models.Principal.model_validate(current_user)
 
 async def get_current_active_user(
     current_user: typing.Annotated[models.User, Depends(get_current_user)]
@@ -46,14 +123,21 @@ async def get_current_active_user(
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
 
+async def get_current_active_principal(
+    principal: typing.Annotated[models.Principal, Depends(get_current_principal)]
+) -> models.Principal:
+    if principal.status != "active":
+        raise HTTPException(status_code=400, detail="Inactive user")
+    return principal
+
 async def get_current_active_superuser(
-    current_user: typing.Annotated[models.User, Depends(get_current_user)],
-) -> models.User:
-    if "admin" not in current_user.roles:
+    principal: typing.Annotated[models.Principal, Depends(get_current_principal)],
+) -> models.Principal:
+    if "admin" not in principal.roles:
         raise HTTPException(
             status_code=400, detail="The user doesn't have enough privileges"
         )
-    return current_user
+    return principal
 
 class RoleChecker:
     def __init__(self, *allowed_roles: list[str]):
@@ -61,7 +145,7 @@ class RoleChecker:
 
     def __call__(
         self,
-        user: typing.Annotated[models.User, Depends(get_current_active_user)],
+        user: typing.Annotated[models.Principal, Depends(get_current_active_principal)],
     ):
         for role in user.roles:
             if role in self.allowed_roles:
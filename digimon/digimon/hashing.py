@@ -0,0 +1,100 @@
+import asyncio
+import concurrent.futures
+
+import bcrypt
+
+
+def hash_password(plain_password: str) -> str:
+    return bcrypt.hashpw(
+        plain_password.encode("utf-8"), salt=bcrypt.gensalt()
+    ).decode("utf-8")
+
+
+def check_password(plain_password: str, hashed_password: str) -> bool:
+    return bcrypt.checkpw(
+        plain_password.encode("utf-8"), hashed_password.encode("utf-8")
+    )
+
+
+# Runs bcrypt in a thread or process pool so a login does not block the event
+# loop. At most `max_workers` hashes run at once and at most `max_queue` wait
+# for a worker, the rest are rejected with 503.
+class PasswordHasher:
+    def __init__(self, max_workers: int = 4, executor: str = "thread", max_queue: int = 256):
+        if executor not in ("thread", "process"):
+            raise ValueError(f"Unknown password hash executor: {executor}")
+
+        self.max_workers = max_workers
+        self.executor = executor
+        self.max_queue = max_queue
+
+        self.running = 0
+        self.waiting = 0
+
+        self._pool = None
+        self._semaphore = asyncio.Semaphore(max_workers)
+
+    @property
+    def queue_depth(self) -> int:
+        return self.waiting
+
+    def _get_pool(self) -> concurrent.futures.Executor:
+        if self._pool is None:
+            if self.executor == "process":
+                self._pool = concurrent.futures.ProcessPoolExecutor(self.max_workers)
+            else:
+                self._pool = concurrent.futures.ThreadPoolExecutor(
+                    self.max_workers, thread_name_prefix="bcrypt"
+                )
+        return self._pool
+
+    async def _run(self, func, *args):
+        if self.max_queue and self.waiting >= self.max_queue:
+            # Imported here so models, and the scripts using them, do not
+            # load fastapi
+            from fastapi import HTTPException, status
+
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many concurrent password checks",
+                headers={"Retry-After": "1"},
+            )
+
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        self.running += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_pool(), func, *args)
+        finally:
+            self.running -= 1
+            self._semaphore.release()
+
+    async def hash_password(self, plain_password: str) -> str:
+        return await self._run(hash_password, plain_password)
+
+    async def verify_password(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(check_password, plain_password, hashed_password)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+
+
+hasher = PasswordHasher()
+
+
+def init_hasher(settings):
+    global hasher
+
+    hasher.shutdown()
+    hasher = PasswordHasher(
+        max_workers=settings.PASSWORD_HASH_WORKERS,
+        executor=settings.PASSWORD_HASH_EXECUTOR,
+        max_queue=settings.PASSWORD_HASH_MAX_QUEUE,
+    )
@@ -0,0 +1,134 @@
+import asyncio
+import contextvars
+import datetime
+import logging
+
+from sqlalchemy import DateTime, Integer, bindparam, column, values
+from sqlmodel import update
+
+from . import models
+
+logger = logging.getLogger(__name__)
+
+# Rows per UPDATE statement, keeps PostgreSQL under its bind parameter limit
+FLUSH_CHUNK_SIZE = 1000
+
+
+# Write-behind buffer for users.last_login_date. /token records the login
+# here and a background task writes every pending timestamp in bulk each
+# `interval` seconds, or as soon as `max_size` users are waiting. Repeated
+# logins of one user collapse into a single row. When the buffer is full and
+# the database cannot keep up, new timestamps are dropped and counted rather
+# than growing memory without bound. The buffer is per worker process.
+class LoginTracker:
+    def __init__(self, interval: float = 5, max_size: int = 10_000):
+        self.interval = interval
+        self.max_size = max_size
+
+        self.dropped = 0
+
+        self._pending: dict[int, datetime.datetime] = {}
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task: asyncio.Task | None = None
+
+    def record(self, user_id: int, last_login_date: datetime.datetime):
+        if user_id not in self._pending and len(self._pending) >= self.max_size:
+            self.dropped += 1
+            return
+
+        self._pending[user_id] = last_login_date
+        if len(self._pending) >= self.max_size:
+            self._wakeup.set()
+
+        # Started on first use so it runs on the serving event loop. A fresh
+        # context keeps its writes out of the query stats of this request.
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(
+                self._run(), context=contextvars.Context()
+            )
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Could not write last login dates")
+
+    async def flush(self):
+        if not self._pending:
+            return
+
+        pending, self._pending = self._pending, {}
+        rows = list(pending.items())
+        try:
+            async with models.async_session() as session:
+                for start in range(0, len(rows), FLUSH_CHUNK_SIZE):
+                    await write_logins(session, rows[start : start + FLUSH_CHUNK_SIZE])
+                await session.commit()
+        except BaseException:
+            # Put the batch back unless a newer login arrived meanwhile, also
+            # when the flush is cancelled
+            for user_id, last_login_date in pending.items():
+                if len(self._pending) >= self.max_size:
+                    break
+                self._pending.setdefault(user_id, last_login_date)
+            raise
+
+    # Lets a flush in progress finish rather than cancelling it, then writes
+    # what was recorded meanwhile
+    async def stop(self):
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+            self._stopping = False
+
+        await self.flush()
+
+
+async def write_logins(
+    session: models.AsyncSession, rows: list[tuple[int, datetime.datetime]]
+):
+    if session.get_bind().dialect.name == "postgresql":
+        # UPDATE users SET ... FROM (VALUES (id, date), ...) AS logins
+        logins = values(
+            column("id", Integer),
+            column("last_login_date", DateTime),
+            name="logins",
+        ).data(rows)
+        await session.execute(
+            update(models.DBUser)
+            .where(models.DBUser.id == logins.c.id)
+            .values(last_login_date=logins.c.last_login_date)
+        )
+        return
+
+    # Elsewhere one executemany. This goes through the table, not the ORM
+    # bulk path, which fails on rows of users deleted since their login.
+    users = models.DBUser.__table__
+    await session.execute(
+        update(users)
+        .where(users.c.id == bindparam("user_id"))
+        .values(last_login_date=bindparam("login_date")),
+        [dict(user_id=user_id, login_date=date) for user_id, date in rows],
+    )
+
+
+tracker = LoginTracker()
+
+
+def init_login_tracker(settings):
+    global tracker
+
+    tracker = LoginTracker(
+        interval=settings.LOGIN_FLUSH_INTERVAL_SECONDS,
+        max_size=settings.LOGIN_BUFFER_SIZE,
+    )
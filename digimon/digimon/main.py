@@ -1,28 +1,56 @@
-from gevent import monkey
-
-monkey.patch_all()
 from fastapi import FastAPI
 from contextlib import asynccontextmanager
+from . import cache
 from . import config
+from . import counts
+from . import hashing
+from . import login_tracker
+from . import metrics
 from . import models
+from . import query_stats
+from . import responses
 from . import routers
+from . import token_cache
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    if app.state.settings.DB_POOL_WARMUP:
+        await models.warm_up_pool()
+
     yield
+    await login_tracker.tracker.stop()
+
     if models.engine is not None:
         # Close the DB connection
-        await models.sesion_close()
+        await models.close_session()
+
+    hashing.hasher.shutdown()
+    await cache.close_cache()
 
 
 def create_app(settings=None):
     if not settings:
         settings = config.get_settings()
+    config.init_settings(settings)
+
+    app_args = {}
+    if settings.FAST_JSON_RESPONSES:
+        app_args["default_response_class"] = responses.FastJSONResponse
+
+    app = FastAPI(lifespan=lifespan, **app_args)
+    app.state.settings = settings
 
-    app = FastAPI(lifespan=lifespan)
+    if settings.DB_SERVER_TIMING:
+        app.add_middleware(query_stats.ServerTimingMiddleware)
 
     models.init_db(settings)
+    counts.init_counts(settings)
+    cache.init_cache(settings)
+    hashing.init_hasher(settings)
+    login_tracker.init_login_tracker(settings)
+    token_cache.init_token_cache(settings)
 
     routers.init_router(app)
+    metrics.init_metrics(app, settings)
     return app
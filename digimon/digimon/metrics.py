@@ -0,0 +1,187 @@
+import bisect
+import math
+import time
+
+from fastapi import Response
+from sqlalchemy.pool import QueuePool
+
+from . import hashing
+from . import models
+from . import token_cache
+
+# Seconds, the upper bounds of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+def label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def sample(name: str, value, labels: dict | None = None) -> str:
+    if labels:
+        pairs = ",".join(f'{key}="{label_value(v)}"' for key, v in labels.items())
+        name = f"{name}{{{pairs}}}"
+    return f"{name} {value}"
+
+
+# Request metrics of this worker process. The gauges of the DB pool, the
+# bcrypt pool and the auth cache are read from those objects when scraped.
+class Metrics:
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.in_flight = 0
+        self.latency: dict[tuple[str, str, int], Histogram] = {}
+
+    def observe(self, method: str, route: str, status: int, seconds: float):
+        key = (method, route, status)
+        histogram = self.latency.get(key)
+        if histogram is None:
+            histogram = self.latency[key] = Histogram(self.buckets)
+        histogram.observe(seconds)
+
+    def render(self) -> str:
+        lines = [
+            "# HELP digimon_http_request_duration_seconds Time to answer a request.",
+            "# TYPE digimon_http_request_duration_seconds histogram",
+        ]
+        name = "digimon_http_request_duration_seconds"
+        for (method, route, status), histogram in sorted(self.latency.items()):
+            labels = dict(method=method, route=route, status=status)
+            count = 0
+            for bound, bucket_count in zip(
+                self.buckets + (math.inf,), histogram.counts
+            ):
+                count += bucket_count
+                le = "+Inf" if bound == math.inf else str(float(bound))
+                lines.append(sample(f"{name}_bucket", count, dict(labels, le=le)))
+            lines.append(sample(f"{name}_sum", histogram.sum, labels))
+            lines.append(sample(f"{name}_count", count, labels))
+
+        gauges = [
+            (
+                "digimon_http_requests_in_flight",
+                "Requests being answered.",
+                self.in_flight,
+            ),
+            (
+                "digimon_password_hash_queue_depth",
+                "Password hashes waiting for a bcrypt worker.",
+                hashing.hasher.queue_depth,
+            ),
+            (
+                "digimon_password_hash_running",
+                "Password hashes running in the bcrypt pool.",
+                hashing.hasher.running,
+            ),
+        ]
+
+        # SQLite uses a NullPool or StaticPool, which have no size
+        if models.engine is not None and isinstance(models.engine.pool, QueuePool):
+            pool = models.engine.pool
+            gauges += [
+                ("digimon_db_pool_size", "Connections the pool keeps.", pool.size()),
+                (
+                    "digimon_db_pool_checked_out",
+                    "Connections in use.",
+                    pool.checkedout(),
+                ),
+                (
+                    "digimon_db_pool_overflow",
+                    "Connections open beyond the pool size.",
+                    max(pool.overflow(), 0),
+                ),
+            ]
+
+        for name, description, value in gauges:
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} gauge"]
+            lines.append(sample(name, value))
+
+        counters = [
+            (
+                "digimon_auth_cache_hits_total",
+                "Access tokens found in the auth cache.",
+                token_cache.cache.hits,
+            ),
+            (
+                "digimon_auth_cache_misses_total",
+                "Access tokens not found in the auth cache.",
+                token_cache.cache.misses,
+            ),
+        ]
+        for name, description, value in counters:
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} counter"]
+            lines.append(sample(name, value))
+
+        return "\n".join(lines) + "\n"
+
+
+registry = Metrics()
+
+
+# Plain ASGI middleware, it only wraps `send` to see the status code. The
+# route label is the path template FastAPI matched, e.g. /items/{item_id},
+# so ids do not create new series.
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # An exception leaves the status at 500, which is what the client gets
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        metrics = registry
+        metrics.in_flight += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            metrics.in_flight -= 1
+            route = scope.get("route")
+            metrics.observe(
+                scope["method"],
+                route.path if route is not None else "unmatched",
+                status_code,
+                time.perf_counter() - started,
+            )
+
+
+async def read_metrics() -> Response:
+    return Response(content=registry.render(), media_type=CONTENT_TYPE)
+
+
+def init_metrics(app, settings):
+    global registry
+
+    registry = Metrics()
+
+    # Disabled adds neither the middleware nor the route
+    if not settings.METRICS_ENABLED:
+        return
+
+    app.add_middleware(MetricsMiddleware)
+    app.add_api_route(
+        settings.METRICS_PATH, read_metrics, methods=["GET"], include_in_schema=False
+    )
@@ -1,10 +1,16 @@
+import asyncio
+import logging
 from typing import AsyncIterator
 from sqlmodel import Field, SQLModel, create_engine, Session, select
 from sqlmodel.ext.asyncio.session import AsyncSession
 
-from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 
+from .. import query_stats
 
 from . import items
 from . import merchants
@@ -19,20 +25,68 @@ from .wallets import *
 from .transactions import *
 
 
+logger = logging.getLogger(__name__)
+
 connect_args = {}
 
 engine = None
+async_session = None
 
 
 def init_db(settings):
-    global engine
+    global engine, async_session
 
-    engine = create_async_engine(
-        settings.SQLDB_URL,
-        echo=True,
+    url = make_url(settings.SQLDB_URL)
+    engine_args = dict(
+        echo=settings.DB_ECHO,
         future=True,
-        connect_args=connect_args,
+        query_cache_size=settings.DB_STATEMENT_CACHE_SIZE,
+        connect_args=dict(connect_args),
+    )
+
+    # SQLite gets a NullPool or StaticPool, neither takes sizing arguments
+    if url.get_backend_name() != "sqlite":
+        engine_args.update(
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+            pool_pre_ping=settings.DB_POOL_PRE_PING,
+        )
+
+    if url.get_driver_name() == "asyncpg":
+        engine_args["connect_args"][
+            "prepared_statement_cache_size"
+        ] = settings.DB_PREPARED_STATEMENT_CACHE_SIZE
+
+    engine = create_async_engine(url, **engine_args)
+    query_stats.init_query_stats(engine.sync_engine, settings)
+    async_session = async_sessionmaker(
+        engine, class_=AsyncSession, expire_on_commit=False
+    )
+
+
+async def warm_up_pool():
+    if engine is None or not isinstance(engine.pool, QueuePool):
+        return
+
+    # Check out pool_size connections at once so the pool opens all of them.
+    # A database that is not up yet only costs the warm-up, the workers still
+    # start and connect on first use.
+    results = await asyncio.gather(
+        *[engine.connect() for _ in range(engine.pool.size())],
+        return_exceptions=True,
     )
+    errors = [result for result in results if isinstance(result, BaseException)]
+    for result in results:
+        if not isinstance(result, BaseException):
+            await result.close()
+
+    if errors:
+        logger.warning(
+            f"Pool warm-up opened {len(results) - len(errors)} of "
+            f"{len(results)} connections: {errors[0]}"
+        )
 
 
 async def recreate_table():
@@ -41,8 +95,69 @@ async def recreate_table():
         await conn.run_sync(SQLModel.metadata.create_all)
 
 
+def upgrade_metadata(connection):
+    inspector = inspect(connection)
+    existing = set(inspector.get_table_names())
+
+    SQLModel.metadata.create_all(
+        connection,
+        tables=[
+            table
+            for table in SQLModel.metadata.sorted_tables
+            if table.name not in existing
+        ],
+    )
+
+    for table in SQLModel.metadata.sorted_tables:
+        if table.name not in existing:
+            continue
+
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in columns:
+                add_column(connection, table, column)
+
+        # Unique indexes fail here if the table already holds duplicates,
+        # those rows have to be cleaned up by hand before upgrading
+        indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in indexes:
+                index.create(connection)
+
+
+def add_column(connection, table, column):
+    preparer = connection.dialect.identifier_preparer
+    table_name = preparer.format_table(table)
+    column_name = preparer.format_column(column)
+    column_type = column.type.compile(dialect=connection.dialect)
+    connection.execute(
+        text(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}")
+    )
+
+    # Existing rows get the model default, then the column is made NOT NULL
+    # where the backend can alter it in place
+    if column.default is not None:
+        value = column.default.arg
+        if column.default.is_callable:
+            value = value(None)
+        connection.execute(
+            table.update().where(column.is_(None)).values({column.name: value})
+        )
+
+    if not column.nullable and connection.dialect.name == "postgresql":
+        connection.execute(
+            text(f"ALTER TABLE {table_name} ALTER COLUMN {column_name} SET NOT NULL")
+        )
+
+
+async def upgrade_table():
+    async with engine.begin() as conn:
+        await conn.run_sync(upgrade_metadata)
+
+
+# FastAPI caches this dependency per request, so get_current_user and the
+# route handler share one session and one pooled connection.
 async def get_session() -> AsyncIterator[AsyncSession]:
-    async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
     async with async_session() as session:
         yield session
 
@@ -19,6 +19,9 @@ class CreatedItem(BaseItem):
 class UpdatedItem(BaseItem):
     pass
 
+class BulkItem(BaseItem):
+    id: int | None = None
+
 class Item(BaseItem):
     id: int
     merchant_id: int
@@ -27,10 +30,10 @@ class Item(BaseItem):
 class DBItem(BaseItem, SQLModel, table=True):
     __tablename__ = "items"
     id: int = Field(default=None, primary_key=True)
-    merchant_id: int = Field(default=None, foreign_key="merchants.id")
+    merchant_id: int = Field(default=None, foreign_key="merchants.id", index=True)
     merchant: merchants.DBMerchant = Relationship()
 
-    user_id: int = Field(default=None, foreign_key="users.id")
+    user_id: int = Field(default=None, foreign_key="users.id", index=True)
     user: users.DBUser | None = Relationship()
 
 class ItemList(BaseModel):
@@ -39,3 +42,16 @@ class ItemList(BaseModel):
     page: int
     page_count: int
     size_per_page: int
+    next_cursor: str | None = None
+
+class BulkItemResult(BaseModel):
+    index: int
+    status: str
+    id: int | None = None
+    detail: str | None = None
+
+class BulkItemResponse(BaseModel):
+    created: int
+    updated: int
+    failed: int
+    results: list[BulkItemResult]
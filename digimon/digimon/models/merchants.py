@@ -1,6 +1,7 @@
 from typing import Optional, List, TYPE_CHECKING
 
 from pydantic import BaseModel, ConfigDict
+from sqlalchemy import Index
 from sqlmodel import Field, SQLModel, create_engine, Session, select, Relationship
 
 from . import users
@@ -29,9 +30,15 @@ class Merchant(BaseMerchant):
 
 class DBMerchant(BaseMerchant, SQLModel, table=True):
     __tablename__ = "merchants"
+    __table_args__ = (
+        # text_pattern_ops lets PostgreSQL use the index for name prefix LIKE
+        Index(
+            "ix_merchants_name", "name", postgresql_ops={"name": "text_pattern_ops"}
+        ),
+    )
     id: Optional[int] = Field(default=None, primary_key=True)
 
-    user_id: int = Field(default=None, foreign_key="users.id")
+    user_id: int = Field(default=None, foreign_key="users.id", index=True)
     user: users.DBUser | None = Relationship()
 
 
@@ -39,6 +46,7 @@ class MerchantList(BaseModel):
     model_config = ConfigDict(from_attributes=True)
     merchants: list[Merchant]
     page: int
-    page_size: int
+    page_count: int
     size_per_page: int
+    next_cursor: str | None = None
 
@@ -2,6 +2,7 @@ from typing import Optional
 import datetime
 import pydantic
 from pydantic import BaseModel, ConfigDict, Field
+from sqlalchemy import Index
 from sqlmodel import Field, SQLModel, create_engine, Session, select, Relationship
 
 from . import users
@@ -26,14 +27,18 @@ class Transaction(BaseTransaction):
     
 class DBTransaction(BaseTransaction, SQLModel, table=True):
     __tablename__ = "transactions"
+    __table_args__ = (
+        # Matches the (transaction_date, id) keyset order of list and export
+        Index("ix_transactions_transaction_date_id", "transaction_date", "id"),
+    )
     id: int = Field(default=None, primary_key=True)
-    merchant_id: int = Field(default=None, foreign_key="merchants.id")
+    merchant_id: int = Field(default=None, foreign_key="merchants.id", index=True)
     merchant: merchants.DBMerchant = Relationship()
 
-    user_id: int = Field(default=None, foreign_key="users.id")
+    user_id: int = Field(default=None, foreign_key="users.id", index=True)
     user: users.DBUser | None = Relationship()
 
-    item_id: int = Field(default=None, foreign_key="items.id")
+    item_id: int = Field(default=None, foreign_key="items.id", index=True)
     item: items.DBItem | None = Relationship()
 
     transaction_date: datetime.datetime = Field(default_factory=datetime.datetime.now)
@@ -44,3 +49,4 @@ class TransactionList(BaseModel):
     page: int
     page_count: int
     size_per_page: int
+    next_cursor: str | None = None
@@ -2,12 +2,13 @@ import datetime
 
 import pydantic
 from pydantic import BaseModel, EmailStr, ConfigDict
+from sqlalchemy import JSON
 from sqlmodel import SQLModel, Field
 
 # from passlib.context import CryptContext
 
 # pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-import bcrypt
+from .. import hashing
 
 
 class BaseUser(BaseModel):
@@ -20,6 +21,8 @@ class BaseUser(BaseModel):
 
 class User(BaseUser):
     id: int
+    roles: list[str] = []
+    status: str = "active"
     last_login_date: datetime.datetime | None = pydantic.Field(
         json_schema_extra=dict(example="2023-01-01T00:00:00.000000"), default=None
     )
@@ -28,6 +31,14 @@ class User(BaseUser):
     )
 
 
+class Principal(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    id: int
+    roles: list[str] = []
+    status: str = "active"
+    token_version: int = 0
+
+
 class ReferenceUser(BaseModel):
     model_config = ConfigDict(from_attributes=True, populate_by_name=True)
     username: str
@@ -83,8 +94,16 @@ class DBUser(BaseUser, SQLModel, table=True):
     __tablename__ = "users"
     id: int | None = Field(default=None, primary_key=True)
 
+    # /token looks a user up by either column, /users/create checks username
+    username: str = Field(unique=True, index=True)
+    email: str = Field(unique=True, index=True)
+
     password: str
 
+    roles: list[str] = Field(default_factory=list, sa_type=JSON)
+    status: str = Field(default="active")
+    token_version: int = Field(default=0)
+
     register_date: datetime.datetime = Field(default_factory=datetime.datetime.now)
     updated_date: datetime.datetime = Field(default_factory=datetime.datetime.now)
     last_login_date: datetime.datetime | None = Field(default=None)
@@ -96,14 +115,19 @@ class DBUser(BaseUser, SQLModel, table=True):
         return False
 
     async def get_encrypted_password(self, plain_password):
-        return bcrypt.hashpw(
-            plain_password.encode("utf-8"), salt=bcrypt.gensalt()
-        ).decode("utf-8")
+        return await hashing.hasher.hash_password(plain_password)
 
     async def set_password(self, plain_password):
         self.password = await self.get_encrypted_password(plain_password)
 
     async def verify_password(self, plain_password):
-        return bcrypt.checkpw(
-            plain_password.encode("utf-8"), self.password.encode("utf-8")
-        )
+        return await hashing.hasher.verify_password(plain_password, self.password)
+
+
+# Refresh token ids that were already exchanged, shared by all workers. A row
+# is only needed until the token expires, after that the signature check
+# rejects it anyway.
+class DBUsedRefreshToken(SQLModel, table=True):
+    __tablename__ = "used_refresh_tokens"
+    jti: str = Field(primary_key=True)
+    expires_at: datetime.datetime = Field(index=True)
@@ -1,6 +1,8 @@
 from typing import Optional
+import datetime
 
 from pydantic import BaseModel, ConfigDict
+from sqlalchemy import UniqueConstraint
 from sqlmodel import Field, SQLModel, create_engine, Session, select, Relationship
 
 from . import users
@@ -24,5 +26,15 @@ class Wallet(BaseWallet):
 class DBWallet(BaseWallet, SQLModel, table=True):
     __tablename__ = "wallets"
     id: int = Field(default=None, primary_key=True)
-    user_id: int = Field(default=None, foreign_key="users.id")
+    # One wallet per user, every wallet route looks it up by user_id
+    user_id: int = Field(default=None, foreign_key="users.id", unique=True, index=True)
     user: users.DBUser | None = Relationship()
+
+class DBWalletTopUp(SQLModel, table=True):
+    __tablename__ = "wallet_topups"
+    __table_args__ = (UniqueConstraint("user_id", "idempotency_key"),)
+    id: int = Field(default=None, primary_key=True)
+    user_id: int = Field(default=None, foreign_key="users.id")
+    idempotency_key: str = Field(max_length=255)
+    amount: float
+    created_date: datetime.datetime = Field(default_factory=datetime.datetime.now)
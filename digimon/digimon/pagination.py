@@ -0,0 +1,38 @@
+import base64
+import datetime
+import json
+
+from fastapi import HTTPException, status
+
+
+def encode_cursor(*values) -> str:
+    data = []
+    for value in values:
+        if isinstance(value, datetime.datetime):
+            value = value.isoformat()
+        data.append(value)
+
+    raw = json.dumps(data, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, *types) -> tuple:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+        if not isinstance(data, list) or len(data) != len(types):
+            raise ValueError("cursor has wrong shape")
+
+        values = []
+        for value, value_type in zip(data, types):
+            if value_type is datetime.datetime:
+                value = datetime.datetime.fromisoformat(value)
+            else:
+                value = value_type(value)
+            values.append(value)
+    except (ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+        )
+
+    return tuple(values)
@@ -0,0 +1,127 @@
+import contextlib
+import contextvars
+import logging
+import time
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+
+# Statements run on behalf of one request, or one block of a test
+class QueryStats:
+    def __init__(self, path: str | None = None):
+        self.path = path
+        self.count = 0
+        self.total = 0.0  # seconds
+        self.slowest = 0.0
+        self.slowest_statement: str | None = None
+
+    def record(self, statement: str, seconds: float):
+        self.count += 1
+        self.total += seconds
+        if seconds >= self.slowest:
+            self.slowest = seconds
+            self.slowest_statement = statement
+
+    def server_timing(self) -> str:
+        return (
+            f'db;dur={self.total * 1000:.1f};desc="{self.count} queries", '
+            f"db-slowest;dur={self.slowest * 1000:.1f}"
+        )
+
+
+# The async engine runs statements in a greenlet that SQLAlchemy starts with
+# the caller's context, so the hooks see the stats of the request awaiting them
+current: contextvars.ContextVar[QueryStats | None] = contextvars.ContextVar(
+    "query_stats", default=None
+)
+
+slow_query_seconds = 0.0
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context.query_started = time.perf_counter()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - context.query_started
+
+    stats = current.get()
+    if stats is not None:
+        stats.record(statement, seconds)
+
+    if slow_query_seconds and seconds >= slow_query_seconds:
+        duration_ms = round(seconds * 1000, 1)
+        logger.warning(
+            f"Slow query {duration_ms} ms: {' '.join(statement.split())}",
+            extra=dict(
+                duration_ms=duration_ms,
+                statement=statement,
+                executemany=executemany,
+                path=stats.path if stats is not None else None,
+            ),
+        )
+
+
+def listen(engine):
+    if not event.contains(engine, "before_cursor_execute", before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", after_cursor_execute)
+
+
+# Called by models.init_db with the sync engine behind the async one. Without
+# Server-Timing or a slow query threshold no hooks are added.
+def init_query_stats(engine, settings):
+    global slow_query_seconds
+
+    slow_query_seconds = settings.DB_SLOW_QUERY_MS / 1000
+    if settings.DB_SERVER_TIMING or slow_query_seconds:
+        listen(engine)
+
+
+# Adds a Server-Timing header with the number of statements, their total time
+# and the slowest one. Only statements run before the response starts count.
+class ServerTimingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats(scope["path"])
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (b"server-timing", stats.server_timing().encode()),
+                ]
+            await send(message)
+
+        token = current.set(stats)
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current.reset(token)
+
+
+# For tests: fails when the block runs more than `max_queries` statements on
+# `engine`, e.g. a list endpoint loading a relationship row by row
+@contextlib.contextmanager
+def assert_max_queries(engine, max_queries: int):
+    listen(engine.sync_engine)
+
+    stats = QueryStats()
+    token = current.set(stats)
+    try:
+        yield stats
+    finally:
+        current.reset(token)
+
+    assert stats.count <= max_queries, (
+        f"{stats.count} queries, expected at most {max_queries}. "
+        f"Slowest: {stats.slowest_statement}"
+    )
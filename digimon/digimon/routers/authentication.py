@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, Security, status
+from fastapi import APIRouter, Depends, Form, HTTPException, Security, status
 from fastapi.security import (
     HTTPAuthorizationCredentials,
     HTTPBasicCredentials,
@@ -7,18 +7,21 @@ from fastapi.security import (
 )
 
 
-from sqlmodel import select
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import select, or_
 from typing import Annotated
 import datetime
+import jwt
 
 from .. import config
+from .. import hashing
+from .. import login_tracker
 from .. import models
 from .. import security
 
 router = APIRouter(tags=["authentication"])
 
-settings = config.get_settings()
-
 
 @router.post(
     "/token",
@@ -28,17 +31,28 @@ async def authentication(
     session: Annotated[models.AsyncSession, Depends(models.get_session)],
 ) -> models.Token:
 
+    # One round-trip over the username and email indexes, loading only what
+    # the password check and the token claims need. A username match wins
+    # over another user's email.
     result = await session.exec(
-        select(models.DBUser).where(models.DBUser.username == form_data.username)
+        select(
+            models.DBUser.id,
+            models.DBUser.password,
+            models.DBUser.roles,
+            models.DBUser.status,
+            models.DBUser.token_version,
+        )
+        .where(
+            or_(
+                models.DBUser.username == form_data.username,
+                models.DBUser.email == form_data.username,
+            )
+        )
+        .order_by((models.DBUser.username == form_data.username).desc())
+        .limit(1)
     )
 
-    user = result.one_or_none()
-
-    if not user:
-        result = await session.exec(
-            select(models.DBUser).where(models.DBUser.email == form_data.username)
-        )
-        user = result.one_or_none()
+    user = result.first()
 
     if not user:
         raise HTTPException(
@@ -46,34 +60,106 @@ async def authentication(
             detail="Incorrect username or password",
         )
 
-    if not await user.verify_password(form_data.password):
+    if not await hashing.hasher.verify_password(form_data.password, user.password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
         )
 
-    user.last_login_date = datetime.datetime.now()
+    last_login_date = datetime.datetime.now()
+    login_tracker.tracker.record(user.id, last_login_date)
+
+    return issue_tokens(user, last_login_date)
+
+
+@router.post("/token/refresh")
+async def refresh(
+    refresh_token: Annotated[str, Form()],
+    session: Annotated[models.AsyncSession, Depends(models.get_session)],
+) -> models.Token:
+    invalid_refresh_token = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid refresh token",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+    try:
+        payload = jwt.decode(
+            refresh_token,
+            config.get_settings().SECRET_KEY,
+            algorithms=[security.ALGORITHM],
+        )
+        user_id = int(payload["sub"])
+        jti = payload["jti"]
+        token_version = payload["ver"]
+        is_refresh_token = payload["typ"] == security.REFRESH_TOKEN
+        is_revoked = security.revoked_tokens.is_revoked(jti)
+    except (jwt.PyJWTError, KeyError, TypeError, ValueError):
+        raise invalid_refresh_token
+
+    if not is_refresh_token or is_revoked:
+        raise invalid_refresh_token
+
+    # Rotation: the token is spent before the first await, so two concurrent
+    # requests with the same token cannot both get a new pair
+    security.revoked_tokens.revoke(jti, payload["exp"])
 
-    session.add(user)
-    await session.commit()
-    await session.refresh(user)
+    if security.is_token_revoked(user_id, token_version):
+        raise invalid_refresh_token
+
+    # The primary key lets only one worker record the id, the others get an
+    # IntegrityError. Rows of expired tokens are removed on the way.
+    now = datetime.datetime.now()
+    await session.execute(
+        delete(models.DBUsedRefreshToken).where(
+            models.DBUsedRefreshToken.expires_at <= now
+        )
+    )
+    session.add(
+        models.DBUsedRefreshToken(
+            jti=jti, expires_at=datetime.datetime.fromtimestamp(payload["exp"])
+        )
+    )
+    try:
+        await session.commit()
+    except IntegrityError:
+        await session.rollback()
+        raise invalid_refresh_token
 
+    # No password check, only the claims of the new access token
+    result = await session.exec(
+        select(
+            models.DBUser.id,
+            models.DBUser.roles,
+            models.DBUser.status,
+            models.DBUser.token_version,
+        ).where(models.DBUser.id == user_id)
+    )
+    user = result.one_or_none()
+
+    if not user or token_version < user.token_version:
+        raise invalid_refresh_token
+
+    return issue_tokens(user, datetime.datetime.now())
+
+
+def issue_tokens(user, issued_at: datetime.datetime) -> models.Token:
+    settings = config.get_settings()
     access_token_expires = datetime.timedelta(
         minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES
     )
     return models.Token(
         access_token=security.create_access_token(
-            data={"sub": user.id},
+            data=security.user_claims(user),
             expires_delta=access_token_expires,
         ),
         refresh_token=security.create_refresh_token(
-            data={"sub": user.id},
-            expires_delta=access_token_expires,
+            data=security.refresh_claims(user)
         ),
         token_type="Bearer",
         scope="",
         expires_in=settings.ACCESS_TOKEN_EXPIRE_MINUTES,
         expires_at=datetime.datetime.now() + access_token_expires,
-        issued_at=user.last_login_date,
+        issued_at=issued_at,
         user_id=user.id,
     )
@@ -1,62 +1,348 @@
-from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
 from typing import Optional, Annotated
-from sqlmodel import Field, SQLModel, Session, select, func
+from pydantic import ValidationError
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlmodel import Field, SQLModel, Session, select, func, insert, update
 from sqlmodel.ext.asyncio.session import AsyncSession
 
+import json
 import math
 
+import asyncpg
+
 from .. import models
+from .. import cache
+from .. import counts
 from .. import deps
+from .. import pagination
+from .. import responses
 
 router = APIRouter(prefix="/items", tags=["items"])
 
 SIZE_PER_PAGE = 50
+BULK_CHUNK_SIZE = 1000
 
 @router.get("")
 async def read_items(
+    request: Request,
+    response: Response,
     session: Annotated[AsyncSession, Depends(models.get_session)],
     page: int = 1,
+    cursor: str | None = None,
+    exact_count: bool = False,
 ) -> models.ItemList:
-    query = select(models.DBItem).offset((page - 1) * SIZE_PER_PAGE).limit(SIZE_PER_PAGE)
+    headers = await cache.list_headers(
+        request, models.DBItem, request.app.state.settings.CACHE_CONTROL_ITEMS
+    )
+    if cache.is_fresh(request, headers):
+        return cache.not_modified(headers)
+    response.headers.update(headers)
+
+    query = select(models.DBItem).order_by(models.DBItem.id).limit(SIZE_PER_PAGE + 1)
+    if cursor:
+        (last_id,) = pagination.decode_cursor(cursor, int)
+        query = query.where(models.DBItem.id > last_id)
+    else:
+        if page < 1:
+            page = 1
+        query = query.offset((page - 1) * SIZE_PER_PAGE)
+
     result = await session.exec(query)
     items = result.all()
 
-    total_items_query = select(func.count(models.DBItem.id))
-    total_result = await session.exec(total_items_query)
-    total_items = total_result.one()
+    next_cursor = None
+    if len(items) > SIZE_PER_PAGE:
+        items = items[:SIZE_PER_PAGE]
+        next_cursor = pagination.encode_cursor(items[-1].id)
+
+    total_items = await counts.provider.count(
+        session, models.DBItem, exact=exact_count
+    )
 
     page_count = math.ceil(total_items / SIZE_PER_PAGE)
 
-    return models.ItemList.model_validate(
-        dict(items=items, page_count=page_count, page=page, size_per_page=SIZE_PER_PAGE)
+    data = dict(
+        items=items,
+        page=page,
+        page_count=page_count,
+        size_per_page=SIZE_PER_PAGE,
+        next_cursor=next_cursor,
     )
+    if request.app.state.settings.FAST_JSON_RESPONSES:
+        data["items"] = responses.rows(models.Item, items)
+        return responses.json_response(data, headers=headers)
+    return models.ItemList.model_validate(data)
 
 @router.post("")
 async def create_item(
     item: models.CreatedItem,
-    current_user: Annotated[models.User, Depends(deps.get_current_user)],
+    current_user: Annotated[models.Principal, Depends(deps.get_current_principal)],
     session: Annotated[AsyncSession, Depends(models.get_session)],
 ) -> models.Item | None:
     dbitem = models.DBItem.model_validate(item)  # Use model_validate
     session.add(dbitem)
     await session.commit()
     await session.refresh(dbitem)
+    counts.provider.add(models.DBItem, 1)
+    await cache.touch(models.DBItem)
     return models.Item.model_validate(dbitem)  # Use model_validate
 
+@router.post("/bulk")
+async def bulk_import_items(
+    request: Request,
+    current_user: Annotated[models.Principal, Depends(deps.get_current_principal)],
+    session: Annotated[AsyncSession, Depends(models.get_session)],
+) -> models.BulkItemResponse:
+    results = []
+    chunk = []
+    async for index, row in read_bulk_rows(request):
+        if isinstance(row, str):
+            results.append(models.BulkItemResult(index=index, status="error", detail=row))
+            continue
+
+        chunk.append((index, row))
+        if len(chunk) >= BULK_CHUNK_SIZE:
+            results.extend(await import_item_chunk(session, chunk, current_user))
+            chunk = []
+
+    if chunk:
+        results.extend(await import_item_chunk(session, chunk, current_user))
+
+    results.sort(key=lambda result: result.index)
+    return models.BulkItemResponse(
+        created=sum(result.status == "created" for result in results),
+        updated=sum(result.status == "updated" for result in results),
+        failed=sum(result.status == "error" for result in results),
+        results=results,
+    )
+
+
+async def read_bulk_rows(request: Request):
+    # Yields (index, BulkItem) for valid rows and (index, message) for bad ones
+    def parse(index, data):
+        try:
+            return index, models.BulkItem.model_validate(data)
+        except ValidationError as e:
+            return index, "; ".join(
+                f"{'.'.join(map(str, error['loc']))}: {error['msg']}"
+                for error in e.errors()
+            )
+
+    def parse_line(index, line):
+        try:
+            return parse(index, json.loads(line))
+        except ValueError:
+            return index, "Invalid JSON"
+
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("application/x-ndjson"):
+        index = 0
+        buffer = b""
+        async for data in request.stream():
+            buffer += data
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                if line.strip():
+                    yield parse_line(index, line)
+                    index += 1
+
+        if buffer.strip():
+            yield parse_line(index, buffer)
+        return
+
+    try:
+        rows = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON")
+    if not isinstance(rows, list):
+        raise HTTPException(status_code=400, detail="Expected a JSON array of items")
+
+    for index, data in enumerate(rows):
+        yield parse(index, data)
+
+
+async def import_item_chunk(
+    session: AsyncSession,
+    chunk: list[tuple[int, models.BulkItem]],
+    current_user: models.Principal,
+) -> list[models.BulkItemResult]:
+    results = []
+    is_admin = "admin" in current_user.roles
+
+    # Items are owned by the caller, whatever the row says
+    for _, row in chunk:
+        row.user_id = current_user.id
+
+    # Reject rows whose foreign keys do not exist, or that touch a merchant
+    # of another user, so one bad row cannot abort the whole chunk
+    update_ids = {row.id for _, row in chunk if row.id is not None}
+    found = await session.exec(
+        select(models.DBItem.id, models.DBItem.merchant_id).where(
+            models.DBItem.id.in_(update_ids)
+        )
+    )
+    item_merchants = dict(found.all())
+
+    merchant_ids = {row.merchant_id for _, row in chunk}
+    merchant_ids.update(item_merchants.values())
+    found = await session.exec(
+        select(models.DBMerchant.id, models.DBMerchant.user_id).where(
+            models.DBMerchant.id.in_(merchant_ids)
+        )
+    )
+    merchant_owners = dict(found.all())
+
+    def is_allowed(merchant_id):
+        return is_admin or merchant_owners.get(merchant_id) == current_user.id
+
+    inserts = []
+    updates = []
+    for index, row in chunk:
+        if row.merchant_id not in merchant_owners:
+            detail = "Merchant not found"
+        elif row.id is not None and row.id not in item_merchants:
+            detail = "Item not found"
+        elif not is_allowed(row.merchant_id) or (
+            row.id is not None and not is_allowed(item_merchants[row.id])
+        ):
+            detail = "Not allowed for this merchant"
+        else:
+            (updates if row.id is not None else inserts).append((index, row))
+            continue
+        results.append(models.BulkItemResult(index=index, status="error", detail=detail))
+
+    try:
+        if inserts:
+            rows = [row.model_dump(exclude={"id"}) for _, row in inserts]
+            if session.get_bind().dialect.name == "postgresql":
+                ids = await copy_items(session, rows)
+            else:
+                result = await session.execute(
+                    insert(models.DBItem).returning(
+                        models.DBItem.id, sort_by_parameter_order=True
+                    ),
+                    rows,
+                )
+                ids = result.scalars().all()
+
+            for (index, _), item_id in zip(inserts, ids):
+                results.append(
+                    models.BulkItemResult(index=index, status="created", id=item_id)
+                )
+
+        if updates:
+            await session.execute(
+                update(models.DBItem), [row.model_dump() for _, row in updates]
+            )
+            for index, row in updates:
+                results.append(
+                    models.BulkItemResult(index=index, status="updated", id=row.id)
+                )
+
+        await session.commit()
+    # COPY runs on the asyncpg connection itself, so its errors are not
+    # wrapped in DBAPIError
+    except (DBAPIError, asyncpg.PostgresError) as e:
+        await session.rollback()
+        detail = str(e.orig if isinstance(e, DBAPIError) else e)
+        results = [result for result in results if result.status == "error"]
+        for index, _ in inserts + updates:
+            results.append(
+                models.BulkItemResult(index=index, status="error", detail=detail)
+            )
+        return results
+
+    if updates:
+        await cache.backend.delete(*[cache_key(row.id) for _, row in updates])
+    if inserts or updates:
+        await cache.touch(models.DBItem)
+    counts.provider.add(models.DBItem, len(inserts))
+    return results
+
+
+async def copy_items(session: AsyncSession, rows: list[dict]) -> list[int]:
+    # COPY the chunk into a temporary table, then insert it in one statement.
+    # ord keeps each row's position in the chunk, so the ids can be returned
+    # in row order.
+    await session.execute(
+        text(
+            "CREATE TEMP TABLE items_import ("
+            "ord integer, name varchar, description varchar, price float8, "
+            "tax float8, merchant_id integer, user_id integer"
+            ") ON COMMIT DROP"
+        )
+    )
+
+    connection = await session.connection()
+    raw_connection = await connection.get_raw_connection()
+    await raw_connection.driver_connection.copy_records_to_table(
+        "items_import",
+        records=[
+            (
+                ord,
+                row["name"],
+                row["description"],
+                row["price"],
+                row["tax"],
+                row["merchant_id"],
+                row["user_id"],
+            )
+            for ord, row in enumerate(rows)
+        ],
+        columns=[
+            "ord", "name", "description", "price", "tax", "merchant_id", "user_id"
+        ],
+    )
+
+    # Neither the order nextval() runs in nor the order of RETURNING is
+    # guaranteed, so draw each row's id next to its ord and read them back
+    # sorted by ord. A CTE that is referenced twice is evaluated only once.
+    result = await session.execute(
+        text(
+            "WITH numbered AS ("
+            "SELECT ord, nextval(pg_get_serial_sequence('items', 'id')) AS id, "
+            "name, description, price, tax, merchant_id, user_id "
+            "FROM items_import"
+            "), inserted AS ("
+            "INSERT INTO items "
+            "(id, name, description, price, tax, merchant_id, user_id) "
+            "SELECT id, name, description, price, tax, merchant_id, user_id "
+            "FROM numbered RETURNING id"
+            ") "
+            "SELECT numbered.id FROM numbered JOIN inserted USING (id) "
+            "ORDER BY numbered.ord"
+        )
+    )
+    return result.scalars().all()
+
+
+def cache_key(item_id: int) -> str:
+    return f"items:{item_id}"
+
+
 @router.get("/{item_id}")
 async def read_item(
-    item_id: int, session: Annotated[AsyncSession, Depends(models.get_session)]
+    item_id: int,
+    request: Request,
+    session: Annotated[AsyncSession, Depends(models.get_session)],
 ) -> models.Item:
-    db_item = await session.get(models.DBItem, item_id)
-    if db_item:
-        return models.Item.model_validate(db_item)  # Use model_validate
-    raise HTTPException(status_code=404, detail="Item not found")
+    # A hit never touches the session, so no connection is checked out
+    body = await cache.backend.get(cache_key(item_id))
+    if body is None:
+        db_item = await session.get(models.DBItem, item_id)
+        if not db_item:
+            raise HTTPException(status_code=404, detail="Item not found")
+        body = models.Item.model_validate(db_item).model_dump_json().encode()
+        await cache.backend.set(cache_key(item_id), body)
+
+    return cache.json_response(request, body)
 
 @router.put("/{item_id}")
 async def update_item(
     item_id: int,
     item: models.UpdatedItem,
-    current_user: Annotated[models.User, Depends(deps.get_current_user)],
+    current_user: Annotated[models.Principal, Depends(deps.get_current_principal)],
     session: Annotated[AsyncSession, Depends(models.get_session)],
 ) -> models.Item:
     data = item.model_dump()  # Use model_dump
@@ -67,17 +353,22 @@ async def update_item(
         setattr(db_item, key, value)
     session.add(db_item)
     await session.commit()
+    await cache.backend.delete(cache_key(item_id))
+    await cache.touch(models.DBItem)
     await session.refresh(db_item)
     return models.Item.model_validate(db_item)  # Use model_validate
 
 @router.delete("/{item_id}")
 async def delete_item(
     item_id: int,
-    current_user: Annotated[models.User, Depends(deps.get_current_user)],
+    current_user: Annotated[models.Principal, Depends(deps.get_current_principal)],
     session: Annotated[AsyncSession, Depends(models.get_session)],
 ) -> dict:
     db_item = await session.get(models.DBItem, item_id)
     await session.delete(db_item)
     await session.commit()
+    await cache.backend.delete(cache_key(item_id))
+    await cache.touch(models.DBItem)
+    counts.provider.add(models.DBItem, -1)
 
     return dict(message="delete success")
@@ -1,59 +1,140 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request, Response
 
 from typing import Optional, Annotated
 
-from sqlmodel import Field, SQLModel, create_engine, Session, select
+from sqlmodel import Field, SQLModel, create_engine, Session, select, func
 from sqlmodel.ext.asyncio.session import AsyncSession
 
+import math
+
 from .. import models
+from .. import cache
+from .. import counts
 from .. import deps
+from .. import pagination
+from .. import responses
 
 
 router = APIRouter(prefix="/merchants")
 
+SIZE_PER_PAGE = 50
+
 
 @router.post("")
 async def create_merchant(
     merchant: models.CreatedMerchant,
-    current_user: Annotated[models.User, Depends(deps.get_current_user)],
+    current_user: Annotated[models.Principal, Depends(deps.get_current_principal)],
     session: Annotated[AsyncSession, Depends(models.get_session)],
 ) -> models.Merchant:
     dbmerchant = models.DBMerchant.model_validate(merchant)
-    dbmerchant.user = current_user
+    dbmerchant.user_id = current_user.id
     session.add(dbmerchant)
     await session.commit()
     await session.refresh(dbmerchant)
+    counts.provider.add(models.DBMerchant, 1)
+    await cache.touch(models.DBMerchant)
 
     return models.Merchant.model_validate(dbmerchant)
 
 
 @router.get("")
 async def read_merchants(
-    session: Annotated[AsyncSession, Depends(models.get_session)]
+    request: Request,
+    response: Response,
+    session: Annotated[AsyncSession, Depends(models.get_session)],
+    page: int = 1,
+    cursor: str | None = None,
+    user_id: int | None = None,
+    name: str | None = None,
+    exact_count: bool = False,
 ) -> models.MerchantList:
-    result = await session.exec(select(models.DBMerchant))
+    headers = await cache.list_headers(
+        request, models.DBMerchant, request.app.state.settings.CACHE_CONTROL_MERCHANTS
+    )
+    if cache.is_fresh(request, headers):
+        return cache.not_modified(headers)
+    response.headers.update(headers)
+
+    if page < 1:
+        page = 1
+
+    filters = []
+    if user_id is not None:
+        filters.append(models.DBMerchant.user_id == user_id)
+    if name:
+        filters.append(models.DBMerchant.name.startswith(name, autoescape=True))
+
+    query = (
+        select(models.DBMerchant)
+        .where(*filters)
+        .order_by(models.DBMerchant.id)
+        .limit(SIZE_PER_PAGE + 1)
+    )
+    if cursor:
+        (last_id,) = pagination.decode_cursor(cursor, int)
+        query = query.where(models.DBMerchant.id > last_id)
+    else:
+        query = query.offset((page - 1) * SIZE_PER_PAGE)
+
+    result = await session.exec(query)
     merchants = result.all()
 
-    return models.MerchantList.model_validate(
-        dict(merchants=merchants, page_size=0, page=0, size_per_page=0)
+    next_cursor = None
+    if len(merchants) > SIZE_PER_PAGE:
+        merchants = merchants[:SIZE_PER_PAGE]
+        next_cursor = pagination.encode_cursor(merchants[-1].id)
+
+    if filters:
+        total_result = await session.exec(
+            select(func.count()).select_from(models.DBMerchant).where(*filters)
+        )
+        total_merchants = total_result.one()
+    else:
+        total_merchants = await counts.provider.count(
+            session, models.DBMerchant, exact=exact_count
+        )
+
+    page_count = math.ceil(total_merchants / SIZE_PER_PAGE)
+
+    data = dict(
+        merchants=merchants,
+        page=page,
+        page_count=page_count,
+        size_per_page=SIZE_PER_PAGE,
+        next_cursor=next_cursor,
     )
+    if request.app.state.settings.FAST_JSON_RESPONSES:
+        data["merchants"] = responses.rows(models.Merchant, merchants)
+        return responses.json_response(data, headers=headers)
+    return models.MerchantList.model_validate(data)
+
+
+def cache_key(merchant_id: int) -> str:
+    return f"merchants:{merchant_id}"
 
 
 @router.get("/{merchant_id}")
 async def read_merchant(
-    merchant_id: int, session: Annotated[AsyncSession, Depends(models.get_session)]
+    merchant_id: int,
+    request: Request,
+    session: Annotated[AsyncSession, Depends(models.get_session)],
 ) -> models.Merchant:
-    db_merchant = await session.get(models.DBMerchant, merchant_id)
-    if db_merchant:
-        return models.Merchant.model_validate(db_merchant)
-    raise HTTPException(status_code=404, detail="Merchant not found")
+    body = await cache.backend.get(cache_key(merchant_id))
+    if body is None:
+        db_merchant = await session.get(models.DBMerchant, merchant_id)
+        if not db_merchant:
+            raise HTTPException(status_code=404, detail="Merchant not found")
+        body = models.Merchant.model_validate(db_merchant).model_dump_json().encode()
+        await cache.backend.set(cache_key(merchant_id), body)
+
+    return cache.json_response(request, body)
 
 
 @router.put("/{merchant_id}")
 async def update_merchant(
     merchant_id: int,
     merchant: models.UpdatedMerchant,
-    current_user: Annotated[models.User, Depends(deps.get_current_user)],
+    current_user: Annotated[models.Principal, Depends(deps.get_current_principal)],
     session: Annotated[AsyncSession, Depends(models.get_session)],
 ) -> models.Merchant:
     data = merchant.model_dump()
@@ -61,6 +142,8 @@ async def update_merchant(
     db_merchant.sqlmodel_update(data)
     session.add(db_merchant)
     await session.commit()
+    await cache.backend.delete(cache_key(merchant_id))
+    await cache.touch(models.DBMerchant)
     await session.refresh(db_merchant)
 
     return models.Merchant.model_validate(db_merchant)
@@ -70,10 +153,13 @@ async def update_merchant(
 async def delete_merchant(
     merchant_id: int,
     session: Annotated[AsyncSession, Depends(models.get_session)],
-    current_user: Annotated[models.User, Depends(deps.get_current_user)],
+    current_user: Annotated[models.Principal, Depends(deps.get_current_principal)],
 ) -> dict:
     db_merchant = await session.get(models.DBMerchant, merchant_id)
     await session.delete(db_merchant)
     await session.commit()
+    await cache.backend.delete(cache_key(merchant_id))
+    await cache.touch(models.DBMerchant)
+    counts.provider.add(models.DBMerchant, -1)
 
     return dict(message="delete success")
@@ -1,70 +1,278 @@
-from fastapi import APIRouter, HTTPException, Depends, Query
-from typing import Optional, Annotated
-from sqlmodel import Field, SQLModel, Session, select, func
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from typing import Optional, Annotated, Literal
+from sqlmodel import Field, SQLModel, Session, select, func, or_, and_, update, insert
 from sqlmodel.ext.asyncio.session import AsyncSession
+import csv
+import datetime
+import io
+import json
 import math
 
 from .. import models
+from .. import cache
+from .. import counts
 from .. import deps
+from .. import pagination
+from .. import responses
 
 router = APIRouter(prefix="/transactions" , tags=["transactions"])
 
 SIZE_PER_PAGE = 50
+MAX_BATCH_SIZE = 1000
+EXPORT_BATCH_SIZE = 1000
+
+EXPORT_COLUMNS = (
+    models.DBTransaction.id,
+    models.DBTransaction.amount,
+    models.DBTransaction.merchant_id,
+    models.DBTransaction.user_id,
+    models.DBTransaction.item_id,
+    models.DBTransaction.transaction_date,
+)
 
 @router.get("")
 async def read_transactions(
+    request: Request,
+    response: Response,
     session: Annotated[AsyncSession, Depends(models.get_session)],
     page: int = 1,
+    cursor: str | None = None,
+    exact_count: bool = False,
 ) -> models.TransactionList:
+    headers = await cache.list_headers(
+        request,
+        models.DBTransaction,
+        request.app.state.settings.CACHE_CONTROL_TRANSACTIONS,
+    )
+    if cache.is_fresh(request, headers):
+        return cache.not_modified(headers)
+    response.headers.update(headers)
+
     if page < 1:
         page = 1
 
-    result = await session.exec(
+    query = (
         select(models.DBTransaction)
-        .offset((page - 1) * SIZE_PER_PAGE)
-        .limit(SIZE_PER_PAGE)
+        .order_by(models.DBTransaction.transaction_date, models.DBTransaction.id)
+        .limit(SIZE_PER_PAGE + 1)
     )
+    if cursor:
+        last_date, last_id = pagination.decode_cursor(cursor, datetime.datetime, int)
+        query = query.where(
+            or_(
+                models.DBTransaction.transaction_date > last_date,
+                and_(
+                    models.DBTransaction.transaction_date == last_date,
+                    models.DBTransaction.id > last_id,
+                ),
+            )
+        )
+    else:
+        query = query.offset((page - 1) * SIZE_PER_PAGE)
+
+    result = await session.exec(query)
     transactions = result.all()
 
-    total_count = await session.exec(select(func.count(models.DBTransaction.id)))
-    page_count = int(math.ceil(total_count.first() / SIZE_PER_PAGE))
+    next_cursor = None
+    if len(transactions) > SIZE_PER_PAGE:
+        transactions = transactions[:SIZE_PER_PAGE]
+        last = transactions[-1]
+        next_cursor = pagination.encode_cursor(last.transaction_date, last.id)
+
+    total_count = await counts.provider.count(
+        session, models.DBTransaction, exact=exact_count
+    )
+    page_count = int(math.ceil(total_count / SIZE_PER_PAGE))
 
-    return models.TransactionList.from_orm(
-        dict(transactions=transactions, page_count=page_count, page=page, size_per_page=SIZE_PER_PAGE)
+    data = dict(
+        transactions=transactions,
+        page=page,
+        page_count=page_count,
+        size_per_page=SIZE_PER_PAGE,
+        next_cursor=next_cursor,
     )
+    if request.app.state.settings.FAST_JSON_RESPONSES:
+        data["transactions"] = responses.rows(models.Transaction, transactions)
+        return responses.json_response(data, headers=headers)
+    return models.TransactionList.from_orm(data)
+
+async def debit_wallet(session: AsyncSession, user_id: int, amount: float):
+    # Check and debit in one statement so concurrent purchases cannot overdraw
+    result = await session.execute(
+        update(models.DBWallet)
+        .where(
+            models.DBWallet.user_id == user_id,
+            models.DBWallet.balance >= amount,
+        )
+        .values(balance=models.DBWallet.balance - amount)
+        .returning(models.DBWallet.id)
+        .execution_options(synchronize_session=False)
+    )
+    if result.first() is None:
+        await session.rollback()
+        wallet = await session.exec(
+            select(models.DBWallet.id).where(models.DBWallet.user_id == user_id)
+        )
+        if wallet.first() is None:
+            raise HTTPException(status_code=404, detail="Wallet not found")
+        raise HTTPException(status_code=400, detail="Not enough money")
 
 @router.post("")
 async def create_transaction(
     transaction: models.CreatedTransaction,
-    current_user: Annotated[models.User, Depends(deps.get_current_user)],
+    current_user: Annotated[models.Principal, Depends(deps.get_current_principal)],
     session: Annotated[AsyncSession, Depends(models.get_session)],
 ) -> models.Transaction | None:
-    wallet = await session.get(models.Wallet, current_user.id)
-    if not wallet:
-        raise HTTPException(status_code=404, detail="Wallet not found")
-
-    item = await session.get(models.Item, transaction.item_id)
+    result = await session.exec(
+        select(models.DBItem.price, models.DBItem.merchant_id).where(
+            models.DBItem.id == transaction.item_id
+        )
+    )
+    item = result.one_or_none()
     if not item:
         raise HTTPException(status_code=404, detail="Item not found")
 
-    if wallet.balance < item.price:
-        raise HTTPException(status_code=400, detail="Not enough money")
-
-    wallet.balance -= item.price
-    session.add(wallet)
-    await session.commit()
-    await session.refresh(wallet)
+    await debit_wallet(session, current_user.id, item.price)
 
     db_transaction = models.DBTransaction(
         amount=transaction.amount,
         item_id=transaction.item_id,
+        merchant_id=item.merchant_id,
         user_id=current_user.id,
     )
     session.add(db_transaction)
     await session.commit()
-    await session.refresh(db_transaction)
+    counts.provider.add(models.DBTransaction, 1)
+    await cache.touch(models.DBTransaction)
     return models.Transaction.from_orm(db_transaction)
 
+@router.post("/batch")
+async def create_transactions(
+    transactions: list[models.CreatedTransaction],
+    current_user: Annotated[models.Principal, Depends(deps.get_current_principal)],
+    session: Annotated[AsyncSession, Depends(models.get_session)],
+) -> list[models.Transaction]:
+    if len(transactions) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {MAX_BATCH_SIZE} transactions per batch",
+        )
+    if not transactions:
+        return []
+
+    item_ids = {transaction.item_id for transaction in transactions}
+    result = await session.exec(
+        select(
+            models.DBItem.id, models.DBItem.price, models.DBItem.merchant_id
+        ).where(models.DBItem.id.in_(item_ids))
+    )
+    items = {item.id: item for item in result.all()}
+
+    missing = item_ids - items.keys()
+    if missing:
+        raise HTTPException(
+            status_code=404, detail=f"Item not found: {sorted(missing)}"
+        )
+
+    total = sum(items[transaction.item_id].price for transaction in transactions)
+    await debit_wallet(session, current_user.id, total)
+
+    now = datetime.datetime.now()
+    result = await session.scalars(
+        insert(models.DBTransaction).returning(
+            models.DBTransaction, sort_by_parameter_order=True
+        ),
+        [
+            dict(
+                amount=transaction.amount,
+                item_id=transaction.item_id,
+                merchant_id=items[transaction.item_id].merchant_id,
+                user_id=current_user.id,
+                transaction_date=now,
+            )
+            for transaction in transactions
+        ],
+    )
+    db_transactions = result.all()
+    await session.commit()
+    counts.provider.add(models.DBTransaction, len(db_transactions))
+    await cache.touch(models.DBTransaction)
+
+    return [
+        models.Transaction.from_orm(db_transaction)
+        for db_transaction in db_transactions
+    ]
+
+# Every user's transactions, so only for finance and admins
+@router.get(
+    "/export", dependencies=[Depends(deps.RoleChecker("admin", "finance"))]
+)
+async def export_transactions(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    start: datetime.datetime | None = None,
+    end: datetime.datetime | None = None,
+    user_id: int | None = None,
+    merchant_id: int | None = None,
+) -> StreamingResponse:
+    query = select(*EXPORT_COLUMNS).order_by(
+        models.DBTransaction.transaction_date, models.DBTransaction.id
+    )
+    if start:
+        query = query.where(models.DBTransaction.transaction_date >= start)
+    if end:
+        query = query.where(models.DBTransaction.transaction_date < end)
+    if user_id is not None:
+        query = query.where(models.DBTransaction.user_id == user_id)
+    if merchant_id is not None:
+        query = query.where(models.DBTransaction.merchant_id == merchant_id)
+
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        stream_transactions(query, format),
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="transactions.{format}"'
+        },
+    )
+
+async def stream_transactions(query, format: str):
+    fields = [column.key for column in EXPORT_COLUMNS]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def encode(rows) -> str:
+        if format == "ndjson":
+            return "".join(
+                json.dumps(dict(zip(fields, row)), default=datetime.datetime.isoformat)
+                + "\n"
+                for row in rows
+            )
+
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(
+            [
+                value.isoformat() if isinstance(value, datetime.datetime) else value
+                for value in row
+            ]
+            for row in rows
+        )
+        return buffer.getvalue()
+
+    if format == "csv":
+        writer.writerow(fields)
+        yield buffer.getvalue()
+
+    # The request session is closed before the body is streamed, so the
+    # export opens its own and reads through a server-side cursor
+    async with models.async_session() as session:
+        result = await session.stream(
+            query.execution_options(yield_per=EXPORT_BATCH_SIZE)
+        )
+        async for rows in result.partitions():
+            yield encode(rows)
+
 @router.get("/{transaction_id}")
 async def read_transaction(
     transaction_id: int, session: Annotated[AsyncSession, Depends(models.get_session)]
@@ -78,13 +286,15 @@ async def read_transaction(
 @router.delete("/{transaction_id}")
 async def delete_transaction(
     transaction_id: int,
-    current_user: Annotated[models.User, Depends(deps.get_current_user)],
+    current_user: Annotated[models.Principal, Depends(deps.get_current_principal)],
     session: Annotated[AsyncSession, Depends(models.get_session)],
 ) -> dict:
     db_transaction = await session.get(models.DBTransaction, transaction_id)
     if db_transaction:
         await session.delete(db_transaction)
         await session.commit()
+        counts.provider.add(models.DBTransaction, -1)
+        await cache.touch(models.DBTransaction)
         return dict(message="delete success")
     else:
         raise HTTPException(status_code=404, detail="Transaction not found")
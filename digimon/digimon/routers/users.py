@@ -1,4 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException, Request, status
+from sqlalchemy.exc import IntegrityError
 from sqlmodel.ext.asyncio.session import AsyncSession
 from sqlmodel import select
 
@@ -6,6 +7,8 @@ from typing import Annotated
 
 from .. import deps
 from .. import models
+from .. import security
+from .. import token_cache
 
 router = APIRouter(prefix="/users", tags=["users"])
 
@@ -52,62 +55,94 @@ async def create(
     user = models.DBUser.from_orm(user_info)
     await user.set_password(user_info.password)
     session.add(user)
-    await session.commit()
+    try:
+        await session.commit()
+    except IntegrityError:
+        # Same email, or the same username registered concurrently
+        await session.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="This username or email is exists.",
+        )
 
     return user
 
 
 @router.put("/{user_id}/change_password")
 async def change_password(
-    user_id: str,
+    user_id: int,
     password_update: models.ChangedPassword,
+    session: Annotated[AsyncSession, Depends(models.get_session)],
     current_user: models.User = Depends(deps.get_current_user),
-) -> dict():
+) -> dict:
 
-    result = await session.get(models.DBUser, user_id)
+    user = await session.get(models.DBUser, user_id)
 
-    if user:
+    if not user:
         raise HTTPException(
-            status_code=HTTP_404_NOT_FOUND,
+            status_code=status.HTTP_404_NOT_FOUND,
             detail="Not found this user",
         )
 
-    if not user.verify_password(password_update.current_password):
+    if not await user.verify_password(password_update.current_password):
         raise HTTPException(
-            status_code=HTTP_401_UNAUTHORIZED,
+            status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect password",
         )
 
-    user.set_password(password_update.new_password)
+    await user.set_password(password_update.new_password)
+    user.token_version += 1
     session.add(user)
     await session.commit()
 
+    token_cache.cache.evict_user(user.id)
+    security.revoke_tokens(user.id, user.token_version)
+
+    return dict(message="change password success")
+
 
 @router.put("/{user_id}/update")
 async def update(
     request: Request,
-    user_id: str,
+    user_id: int,
     user_update: models.UpdatedUser,
+    session: Annotated[AsyncSession, Depends(models.get_session)],
     current_user: models.User = Depends(deps.get_current_user),
 ) -> models.User:
 
+    # Only the owner or an admin, checked before the lookup so other users
+    # cannot tell which ids exist
+    if user_id != current_user.id and "admin" not in current_user.roles:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not allowed to update this user",
+        )
+
     db_user = await session.get(models.DBUser, user_id)
 
-    if db_user:
+    if not db_user:
         raise HTTPException(
-            status_code=HTTP_404_NOT_FOUND,
+            status_code=status.HTTP_404_NOT_FOUND,
             detail="Not found this user",
         )
 
-    if not db_user.verify_password(password_update.current_password):
+    if sorted(user_update.roles) != sorted(db_user.roles) and (
+        "admin" not in current_user.roles
+    ):
         raise HTTPException(
-            status_code=HTTP_401_UNAUTHORIZED,
-            detail="Incorrect password",
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admin can change roles",
         )
 
-    db_user.sqlmodel_update(user_update)
+    if sorted(user_update.roles) != sorted(db_user.roles):
+        db_user.token_version += 1
+
+    db_user.sqlmodel_update(user_update.model_dump())
     session.add(db_user)
     await session.commit()
     await session.refresh(db_user)
 
+    token_cache.cache.evict_user(db_user.id)
+    security.revoke_tokens(db_user.id, db_user.token_version)
+
     return db_user
@@ -1,8 +1,9 @@
-from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi import APIRouter, HTTPException, Depends, Header, Query
 
 from typing import Optional, Annotated
 
-from sqlmodel import Field, SQLModel, Session, select, func
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Field, SQLModel, Session, select, func, update
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 import math
@@ -14,7 +15,7 @@ router = APIRouter(prefix="/wallets", tags=["wallets"])
 
 @router.get("/me")
 async def get_wallet(
-    current_user: Annotated[models.User, Depends(deps.get_current_user)],
+    current_user: Annotated[models.Principal, Depends(deps.get_current_principal)],
     session: Annotated[AsyncSession, Depends(models.get_session)],) -> models.Wallet:
 
     # Query to find the wallet based on the foreign key relationship
@@ -31,36 +32,83 @@ async def get_wallet(
 @router.put("/balance/{balance}")
 async def add_wallet_balance(
     balance: float,
-    current_user: Annotated[models.User, Depends(deps.get_current_user)],
+    current_user: Annotated[models.Principal, Depends(deps.get_current_principal)],
     session: Annotated[AsyncSession, Depends(models.get_session)],
+    idempotency_key: Annotated[str | None, Header(max_length=255)] = None,
 ) -> models.Wallet:
-    # Query to find the wallet based on the foreign key relationship
+    if idempotency_key:
+        # The key is recorded in the same commit as the credit, so a retried
+        # request finds it and returns the wallet without crediting again
+        session.add(
+            models.DBWalletTopUp(
+                user_id=current_user.id,
+                idempotency_key=idempotency_key,
+                amount=balance,
+            )
+        )
+        try:
+            await session.flush()
+        except IntegrityError:
+            await session.rollback()
+            return await get_replayed_top_up(
+                session, current_user.id, idempotency_key, balance
+            )
+
     result = await session.execute(
-        select(models.DBWallet).where(models.DBWallet.user_id == current_user.id)
+        update(models.DBWallet)
+        .where(models.DBWallet.user_id == current_user.id)
+        .values(balance=models.DBWallet.balance + balance)
+        .returning(models.DBWallet)
+        .execution_options(synchronize_session=False, populate_existing=True)
     )
     wallet = result.scalar_one_or_none()
 
     if wallet:
-        wallet.balance += balance
-
         await session.commit()
-        await session.refresh(wallet)
-
         return models.Wallet.from_orm(wallet)
 
+    await session.rollback()
     raise HTTPException(status_code=404, detail="Wallet not found")
 
 
+async def get_replayed_top_up(
+    session: AsyncSession, user_id: int, idempotency_key: str, balance: float
+) -> models.Wallet:
+    result = await session.exec(
+        select(models.DBWalletTopUp.amount).where(
+            models.DBWalletTopUp.user_id == user_id,
+            models.DBWalletTopUp.idempotency_key == idempotency_key,
+        )
+    )
+    if result.one() != balance:
+        raise HTTPException(
+            status_code=409, detail="Idempotency key was used for another amount"
+        )
+
+    result = await session.exec(
+        select(models.DBWallet).where(models.DBWallet.user_id == user_id)
+    )
+    wallet = result.one_or_none()
+    if wallet:
+        return models.Wallet.from_orm(wallet)
+
+    raise HTTPException(status_code=404, detail="Wallet not found")
+
 
 @router.post("")
 async def create_wallet(
     wallet: models.CreatedWallet,
-    current_user: Annotated[models.User, Depends(deps.get_current_user)],
+    current_user: Annotated[models.Principal, Depends(deps.get_current_principal)],
     session: Annotated[AsyncSession, Depends(models.get_session)],
 ) -> models.Wallet | None:
     dbwallet = models.DBWallet.model_validate(wallet)
+    dbwallet.user_id = current_user.id
     session.add(dbwallet)
-    await session.commit()
+    try:
+        await session.commit()
+    except IntegrityError:
+        await session.rollback()
+        raise HTTPException(status_code=409, detail="This user already has a wallet")
     await session.refresh(dbwallet)
 
     return models.Wallet.from_orm(dbwallet)
@@ -68,7 +116,7 @@ async def create_wallet(
 
 @router.delete("/me")
 async def delete_wallet(
-    current_user: Annotated[models.User, Depends(deps.get_current_user)],
+    current_user: Annotated[models.Principal, Depends(deps.get_current_principal)],
     session: Annotated[AsyncSession, Depends(models.get_session)],
 ) -> dict:
     
@@ -1,2 +1,166 @@
-from main import create_app
-app = create_app()
+import argparse
+import importlib.util
+import os
+
+from . import config
+
+
+def main():
+    import uvicorn
+
+    settings = config.get_settings()
+    uvicorn.run(
+        "digimon.main:create_app",
+        factory=True,
+        host=settings.HOST,
+        port=settings.PORT,
+        loop=settings.EVENT_LOOP,
+        http=settings.HTTP_PARSER,
+    )
+
+
+def cpu_count() -> int:
+    # CPUs this process may run on, which a container can limit
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+# Each worker keeps half of its share of the budget open and may overflow
+# into the other half, so all workers together never exceed the budget.
+def pool_sizes(budget: int, workers: int) -> tuple[int, int]:
+    per_worker = budget // workers
+    if per_worker < 1:
+        raise SystemExit(
+            f"DB_CONNECTION_BUDGET of {budget} is too small for {workers} workers"
+        )
+
+    pool_size = (per_worker + 1) // 2
+    return pool_size, per_worker - pool_size
+
+
+def has_gunicorn() -> bool:
+    return all(
+        importlib.util.find_spec(name) is not None
+        for name in ("gunicorn", "uvicorn_worker")
+    )
+
+
+def run_gunicorn(settings, workers: int):
+    from gunicorn.app.base import BaseApplication
+    from uvicorn_worker import UvicornWorker
+
+    class Worker(UvicornWorker):
+        CONFIG_KWARGS = {"loop": settings.EVENT_LOOP, "http": settings.HTTP_PARSER}
+
+    def post_fork(server, worker):
+        from . import models
+
+        # A preloaded engine has no connections yet, but never share a pool
+        # between processes
+        if models.engine is not None:
+            models.engine.sync_engine.dispose(close=False)
+
+    options = dict(
+        bind=f"{settings.HOST}:{settings.PORT}",
+        workers=workers,
+        worker_class=Worker,
+        preload_app=settings.WEB_PRELOAD,
+        keepalive=settings.WEB_KEEPALIVE_SECONDS,
+        graceful_timeout=settings.WEB_GRACEFUL_TIMEOUT_SECONDS,
+        max_requests=settings.WEB_MAX_REQUESTS,
+        # Spread the restarts so the workers are not replaced all at once
+        max_requests_jitter=settings.WEB_MAX_REQUESTS // 10,
+        post_fork=post_fork,
+    )
+
+    # SIGHUP starts new workers and stops the old ones once they finish
+    # their requests. A preloaded app is not imported again, restart the
+    # master to deploy new code.
+    class Application(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from .main import create_app
+
+            return create_app(settings)
+
+    Application().run()
+
+
+def run_uvicorn(settings, workers: int):
+    import uvicorn
+
+    # Workers are spawned and import the app themselves, there is no preload.
+    # SIGHUP replaces them one at a time, each new worker starts before the
+    # old one stops.
+    uvicorn.run(
+        "digimon.main:create_app",
+        factory=True,
+        host=settings.HOST,
+        port=settings.PORT,
+        loop=settings.EVENT_LOOP,
+        http=settings.HTTP_PARSER,
+        workers=workers,
+        timeout_keep_alive=settings.WEB_KEEPALIVE_SECONDS,
+        timeout_graceful_shutdown=settings.WEB_GRACEFUL_TIMEOUT_SECONDS,
+        limit_max_requests=settings.WEB_MAX_REQUESTS or None,
+    )
+
+
+def serve(settings):
+    workers = settings.WEB_WORKERS or cpu_count()
+
+    if settings.DB_CONNECTION_BUDGET:
+        pool_size, max_overflow = pool_sizes(settings.DB_CONNECTION_BUDGET, workers)
+        # gunicorn workers get this settings object, uvicorn spawns its
+        # workers and they read their settings from the environment
+        settings.DB_POOL_SIZE = pool_size
+        settings.DB_MAX_OVERFLOW = max_overflow
+        os.environ["DB_POOL_SIZE"] = str(pool_size)
+        os.environ["DB_MAX_OVERFLOW"] = str(max_overflow)
+
+    server = settings.WEB_SERVER
+    if server == "auto":
+        server = "gunicorn" if has_gunicorn() else "uvicorn"
+
+    if server == "gunicorn":
+        run_gunicorn(settings, workers)
+    elif server == "uvicorn":
+        run_uvicorn(settings, workers)
+    else:
+        raise SystemExit(f"Unknown WEB_SERVER: {server}")
+
+
+def cli():
+    parser = argparse.ArgumentParser(prog="digimon")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = commands.add_parser(
+        "serve", help="start the API with one worker per CPU"
+    )
+    serve_parser.add_argument("--host")
+    serve_parser.add_argument("--port", type=int)
+    serve_parser.add_argument("--workers", type=int)
+    serve_parser.add_argument("--server", choices=["auto", "gunicorn", "uvicorn"])
+    args = parser.parse_args()
+
+    settings = config.get_settings()
+    for name, setting in [
+        ("host", "HOST"),
+        ("port", "PORT"),
+        ("workers", "WEB_WORKERS"),
+        ("server", "WEB_SERVER"),
+    ]:
+        value = getattr(args, name)
+        if value is not None:
+            setattr(settings, setting, value)
+
+    if args.command == "serve":
+        serve(settings)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,7 @@
 import datetime
+import heapq
+import time
+import uuid
 from typing import Any, Union
 
 import jwt
@@ -8,10 +11,83 @@ from . import config
 
 ALGORITHM = "HS256"
 
-settings = config.get_settings()
+ACCESS_TOKEN = "access"
+REFRESH_TOKEN = "refresh"
+
+# Highest token version seen per user in this worker. Tokens that carry an
+# older version were issued before a password, role or status change. A
+# change made through another worker is only seen here once the version is
+# read from the database again, see version_check_due.
+token_versions: dict[int, int] = {}
+token_versions_checked: dict[int, float] = {}  # time.monotonic() of the read
+
+
+def user_claims(user) -> dict:
+    claims = {"sub": str(user.id)}
+    if config.get_settings().AUTH_STATELESS_TOKENS:
+        claims.update(
+            roles=list(user.roles), status=user.status, ver=user.token_version
+        )
+    return claims
+
+
+def refresh_claims(user) -> dict:
+    # The version is always included so a password change ends the session
+    return {"sub": str(user.id), "ver": user.token_version}
+
+
+# Refresh token ids this worker already exchanged, which answers a replay to
+# the same worker without a query. An id is only kept until the token it
+# belongs to expires, after which the signature check rejects the token
+# anyway. Ids are stored as 16 raw bytes. The used_refresh_tokens table is
+# what stops a token from being exchanged on two workers.
+class RevokedTokens:
+    def __init__(self):
+        self._expires: dict[bytes, float] = {}
+        self._queue: list[tuple[float, bytes]] = []
+
+    def revoke(self, jti: str, expires_at: float):
+        key = uuid.UUID(hex=jti).bytes
+        self._expires[key] = expires_at
+        heapq.heappush(self._queue, (expires_at, key))
+        self._purge()
+
+    def is_revoked(self, jti: str) -> bool:
+        return uuid.UUID(hex=jti).bytes in self._expires
+
+    def __len__(self) -> int:
+        return len(self._expires)
+
+    def _purge(self):
+        now = time.time()
+        while self._queue and self._queue[0][0] <= now:
+            _, key = heapq.heappop(self._queue)
+            self._expires.pop(key, None)
+
+
+revoked_tokens = RevokedTokens()
+
+
+def record_token_version(user_id: int, token_version: int):
+    token_versions[user_id] = max(token_versions.get(user_id, 0), token_version)
+    token_versions_checked[user_id] = time.monotonic()
+
+
+def revoke_tokens(user_id: int, token_version: int):
+    record_token_version(user_id, token_version)
+
+
+def version_check_due(user_id: int, ttl: float) -> bool:
+    checked = token_versions_checked.get(user_id)
+    return checked is None or time.monotonic() - checked >= ttl
+
+
+def is_token_revoked(user_id: int, token_version: int) -> bool:
+    return token_version < token_versions.get(user_id, 0)
 
 
 def create_access_token(data: dict, expires_delta: datetime.timedelta | None = None):
+    settings = config.get_settings()
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.datetime.now(tz=datetime.timezone.utc) + expires_delta
@@ -19,7 +95,7 @@ def create_access_token(data: dict, expires_delta: datetime.timedelta | None = N
         expire = datetime.datetime.now(tz=datetime.timezone.utc) + datetime.timedelta(
             minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES
         )
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "typ": ACCESS_TOKEN})
 
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
@@ -28,6 +104,7 @@ def create_access_token(data: dict, expires_delta: datetime.timedelta | None = N
 def create_refresh_token(
     data: dict, expires_delta: datetime.timedelta | None = None
 ) -> str:
+    settings = config.get_settings()
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.datetime.now(tz=datetime.timezone.utc) + expires_delta
@@ -35,6 +112,6 @@ def create_refresh_token(
         expire = datetime.datetime.now(tz=datetime.timezone.utc) + datetime.timedelta(
             minutes=settings.REFRESH_TOKEN_EXPIRE_MINUTES
         )
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "typ": REFRESH_TOKEN, "jti": uuid.uuid4().hex})
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
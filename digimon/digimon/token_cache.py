@@ -0,0 +1,87 @@
+import collections
+import time
+
+
+# Bounded LRU of verified access tokens. Each entry keeps the decoded claims
+# and a snapshot of the user so authenticated requests can skip the user
+# query. Entries expire after `ttl` seconds or when the token expires,
+# whichever comes first. The cache is per worker process.
+class TokenCache:
+    def __init__(self, max_size: int = 10_000, ttl: int = 60):
+        self.max_size = max_size
+        self.ttl = ttl
+
+        self.hits = 0
+        self.misses = 0
+
+        self._entries: collections.OrderedDict[str, tuple] = collections.OrderedDict()
+        self._tokens_by_user: dict[int, set[str]] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0 and self.ttl > 0
+
+    def get(self, token: str):
+        if not self.enabled:
+            return None
+
+        entry = self._entries.get(token)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, user_id, value = entry
+        if expires_at <= time.monotonic():
+            self._remove(token)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(token)
+        self.hits += 1
+        return value
+
+    def set(self, token: str, user_id: int, value, token_exp: float | None = None):
+        if not self.enabled:
+            return
+
+        expires_at = time.monotonic() + self.ttl
+        if token_exp is not None:
+            expires_at = min(expires_at, time.monotonic() + token_exp - time.time())
+
+        self._remove(token)
+        self._entries[token] = (expires_at, user_id, value)
+        self._tokens_by_user.setdefault(user_id, set()).add(token)
+
+        while len(self._entries) > self.max_size:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+
+    def evict_user(self, user_id: int):
+        for token in self._tokens_by_user.pop(user_id, set()):
+            self._entries.pop(token, None)
+
+    def clear(self):
+        self._entries.clear()
+        self._tokens_by_user.clear()
+
+    def _remove(self, token: str):
+        entry = self._entries.pop(token, None)
+        if entry is None:
+            return
+
+        tokens = self._tokens_by_user.get(entry[1])
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[entry[1]]
+
+
+cache = TokenCache()
+
+
+def init_token_cache(settings):
+    global cache
+
+    cache = TokenCache(
+        max_size=settings.AUTH_CACHE_SIZE, ttl=settings.AUTH_CACHE_TTL_SECONDS
+    )
@@ -0,0 +1,52 @@
+import argparse
+import asyncio
+import time
+
+import httpx
+
+# Buys the same items one request at a time and then through /transactions/batch
+# against a running server, and prints the time per purchased item.
+#
+#   python perf-test/bench_batch_purchase.py --item-id 1 --items 500
+
+
+async def main(args):
+    async with httpx.AsyncClient(base_url=args.host, timeout=120) as client:
+        response = await client.post(
+            "/token", data=dict(username=args.username, password=args.password)
+        )
+        response.raise_for_status()
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        item = (await client.get(f"/items/{args.item_id}")).json()
+        await client.put(
+            f"/wallets/balance/{item['price'] * args.items * 2}", headers=headers
+        )
+        purchase = dict(item_id=args.item_id, merchant_id=item["merchant_id"])
+
+        started = time.perf_counter()
+        for _ in range(args.items):
+            response = await client.post("/transactions", json=purchase, headers=headers)
+            response.raise_for_status()
+        single = time.perf_counter() - started
+
+        started = time.perf_counter()
+        response = await client.post(
+            "/transactions/batch", json=[purchase] * args.items, headers=headers
+        )
+        response.raise_for_status()
+        batch = time.perf_counter() - started
+
+    print(f"single requests: {single / args.items * 1000:8.3f} ms/item")
+    print(f"batch request:   {batch / args.items * 1000:8.3f} ms/item")
+    print(f"speedup:         {single / batch:8.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="http://localhost:8000")
+    parser.add_argument("--username", default="user1")
+    parser.add_argument("--password", default="123456")
+    parser.add_argument("--item-id", type=int, required=True)
+    parser.add_argument("--items", type=int, default=500)
+    asyncio.run(main(parser.parse_args()))
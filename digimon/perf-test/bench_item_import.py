@@ -0,0 +1,64 @@
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+# Imports --items rows through POST /items/bulk as one NDJSON stream and a
+# --sample of rows through POST /items, then compares rows per second.
+#
+#   python perf-test/bench_item_import.py --merchant-id 1 --items 100000
+
+
+async def main(args):
+    async with httpx.AsyncClient(base_url=args.host, timeout=600) as client:
+        response = await client.post(
+            "/token", data=dict(username=args.username, password=args.password)
+        )
+        response.raise_for_status()
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        def item(i):
+            return dict(
+                name=f"bench-item-{i}",
+                description="imported by bench_item_import",
+                price=float(i % 1000),
+                merchant_id=args.merchant_id,
+            )
+
+        started = time.perf_counter()
+        for i in range(args.sample):
+            response = await client.post("/items", json=item(i), headers=headers)
+            response.raise_for_status()
+        single = args.sample / (time.perf_counter() - started)
+
+        async def ndjson():
+            for i in range(args.items):
+                yield (json.dumps(item(i)) + "\n").encode("utf-8")
+
+        started = time.perf_counter()
+        response = await client.post(
+            "/items/bulk",
+            content=ndjson(),
+            headers=dict(headers, **{"Content-Type": "application/x-ndjson"}),
+        )
+        response.raise_for_status()
+        bulk = args.items / (time.perf_counter() - started)
+        result = response.json()
+
+    print(f"per-item endpoint: {single:10.1f} rows/s ({args.sample} rows)")
+    print(f"bulk endpoint:     {bulk:10.1f} rows/s ({args.items} rows)")
+    print(f"bulk result:       created={result['created']} failed={result['failed']}")
+    print(f"speedup:           {bulk / single:10.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="http://localhost:8000")
+    parser.add_argument("--username", default="user1")
+    parser.add_argument("--password", default="123456")
+    parser.add_argument("--merchant-id", type=int, required=True)
+    parser.add_argument("--items", type=int, default=100_000)
+    parser.add_argument("--sample", type=int, default=1000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,112 @@
+import argparse
+import asyncio
+import datetime
+import time
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from digimon import models, responses
+
+# Times turning one 50-row page of ORM rows into response bytes, in process
+# and without a database:
+#   default: model_validate in the router, then FastAPI validates and encodes
+#            the declared return type and JSONResponse runs json.dumps
+#   fast:    responses.rows copies the declared fields out of the rows and
+#            responses.json_response encodes the page once (orjson when
+#            installed, pydantic-core otherwise)
+#
+#   PYTHONPATH=. python perf-test/bench_serialization.py --rounds 2000
+
+
+def item_page(rows):
+    items = [
+        models.DBItem(
+            id=i,
+            name=f"item-{i}",
+            description="An item description",
+            price=i * 1.5,
+            tax=0.07,
+            merchant_id=1,
+            user_id=1,
+        )
+        for i in range(rows)
+    ]
+    return models.ItemList, models.Item, "items", dict(
+        items=items, page=1, page_count=20, size_per_page=rows, next_cursor="MTA"
+    )
+
+
+def transaction_page(rows):
+    now = datetime.datetime.now()
+    transactions = [
+        models.DBTransaction(
+            id=i,
+            amount=1,
+            merchant_id=1,
+            user_id=1,
+            item_id=i,
+            transaction_date=now,
+        )
+        for i in range(rows)
+    ]
+    return models.TransactionList, models.Transaction, "transactions", dict(
+        transactions=transactions,
+        page=1,
+        page_count=20,
+        size_per_page=rows,
+        next_cursor="MTA",
+    )
+
+
+# FastAPI builds the response field once per route
+response_fields = {
+    model: create_response_field(name="response", type_=model)
+    for model in (models.ItemList, models.TransactionList)
+}
+
+
+async def default_path(page):
+    model, _, _, data = page
+    content = await serialize_response(
+        field=response_fields[model], response_content=model.model_validate(data)
+    )
+    return JSONResponse(content).body
+
+
+async def fast_path(page):
+    _, row_model, key, data = page
+    return responses.json_response(
+        dict(data, **{key: responses.rows(row_model, data[key])})
+    ).body
+
+
+async def measure(path, page, rounds) -> float:
+    await path(page)
+
+    started = time.perf_counter()
+    for _ in range(rounds):
+        await path(page)
+    return (time.perf_counter() - started) / rounds * 1_000_000
+
+
+async def main(args):
+    print(f"encoder: {'orjson' if responses.orjson else 'pydantic-core'}")
+    for page in [item_page(args.rows), transaction_page(args.rows)]:
+        model = page[0]
+        assert await default_path(page) == await fast_path(page)
+
+        default = await measure(default_path, page, args.rounds)
+        fast = await measure(fast_path, page, args.rounds)
+        print(
+            f"{model.__name__:16} default {default:8.1f} us  "
+            f"fast {fast:8.1f} us  speedup {default / fast:5.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=2000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,99 @@
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+# Starts the API through digimon.run in each mode, measures the time until it
+# answers its first request, then the requests per second it serves:
+#   gevent:  the old startup, gevent.monkey.patch_all() before the app loads
+#   asyncio: plain asyncio event loop and the h11 parser
+#   uvloop:  uvloop event loop and the httptools parser
+#
+# The database in SQLDB_URL must exist.
+#
+#   PYTHONPATH=. python perf-test/bench_server.py --path /items --seconds 10
+
+MODES = {
+    "gevent": (
+        "from gevent import monkey; monkey.patch_all(); "
+        "from digimon import run; run.main()",
+        dict(EVENT_LOOP="asyncio", HTTP_PARSER="h11"),
+    ),
+    "asyncio": (
+        "from digimon import run; run.main()",
+        dict(EVENT_LOOP="asyncio", HTTP_PARSER="h11"),
+    ),
+    "uvloop": (
+        "from digimon import run; run.main()",
+        dict(EVENT_LOOP="uvloop", HTTP_PARSER="httptools"),
+    ),
+}
+
+
+async def wait_until_ready(client, path, timeout=60) -> float:
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        try:
+            await client.get(path)
+            return time.perf_counter() - started
+        except httpx.TransportError:
+            await asyncio.sleep(0.01)
+    raise TimeoutError("server did not start")
+
+
+async def load(client, path, seconds, concurrency) -> float:
+    done = 0
+    deadline = time.perf_counter() + seconds
+
+    async def worker():
+        nonlocal done
+        while time.perf_counter() < deadline:
+            response = await client.get(path)
+            response.raise_for_status()
+            done += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return done / (time.perf_counter() - started)
+
+
+async def bench(mode, args):
+    code, env = MODES[mode]
+    env = dict(os.environ, PORT=str(args.port), **env)
+
+    server = subprocess.Popen(
+        [sys.executable, "-c", code],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        base_url = f"http://127.0.0.1:{args.port}"
+        async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+            startup = await wait_until_ready(client, args.path)
+            await load(client, args.path, 1, args.concurrency)
+            rps = await load(client, args.path, args.seconds, args.concurrency)
+    finally:
+        server.terminate()
+        server.wait()
+
+    print(f"{mode:8} startup {startup * 1000:8.1f} ms  {rps:10.1f} req/s")
+
+
+async def main(args):
+    for mode in args.modes:
+        await bench(mode, args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--path", default="/")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    asyncio.run(main(parser.parse_args()))
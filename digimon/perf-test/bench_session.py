@@ -0,0 +1,44 @@
+import asyncio
+import time
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from digimon import models
+
+ITERATIONS = 100_000
+
+
+async def per_request_sessionmaker(engine):
+    # What get_session used to do on every request
+    async_session = sessionmaker(engine, class_=models.AsyncSession, expire_on_commit=False)
+    async with async_session() as session:
+        pass
+
+
+async def shared_factory(factory):
+    async with factory() as session:
+        pass
+
+
+async def bench(name, make_call):
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        await make_call()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<24} {elapsed / ITERATIONS * 1_000_000:8.2f} us/request")
+
+
+async def main():
+    engine = create_async_engine("sqlite+aiosqlite://")
+    factory = async_sessionmaker(
+        engine, class_=models.AsyncSession, expire_on_commit=False
+    )
+
+    await bench("sessionmaker per request", lambda: per_request_sessionmaker(engine))
+    await bench("shared session factory", lambda: shared_factory(factory))
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,58 @@
+import argparse
+import asyncio
+import time
+
+import httpx
+
+# Renews a session --requests times through /token (password + bcrypt) and
+# through /token/refresh against a running server, --concurrency clients at a
+# time, and prints the throughput of both.
+#
+#   python perf-test/bench_token_refresh.py --requests 500 --concurrency 20
+
+
+async def main(args):
+    async with httpx.AsyncClient(base_url=args.host, timeout=120) as client:
+        credentials = dict(username=args.username, password=args.password)
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def login():
+            async with semaphore:
+                response = await client.post("/token", data=credentials)
+                response.raise_for_status()
+
+        started = time.perf_counter()
+        await asyncio.gather(*[login() for _ in range(args.requests)])
+        password = args.requests / (time.perf_counter() - started)
+
+        # Each client keeps rotating its own refresh token
+        async def refresh_chain(count):
+            response = await client.post("/token", data=credentials)
+            refresh_token = response.json()["refresh_token"]
+            for _ in range(count):
+                response = await client.post(
+                    "/token/refresh", data=dict(refresh_token=refresh_token)
+                )
+                response.raise_for_status()
+                refresh_token = response.json()["refresh_token"]
+
+        per_client = args.requests // args.concurrency
+        started = time.perf_counter()
+        await asyncio.gather(
+            *[refresh_chain(per_client) for _ in range(args.concurrency)]
+        )
+        refresh = per_client * args.concurrency / (time.perf_counter() - started)
+
+    print(f"/token:         {password:10.1f} req/s")
+    print(f"/token/refresh: {refresh:10.1f} req/s")
+    print(f"speedup:        {refresh / password:10.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="http://localhost:8000")
+    parser.add_argument("--username", default="user1")
+    parser.add_argument("--password", default="123456")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
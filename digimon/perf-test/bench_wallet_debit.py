@@ -0,0 +1,64 @@
+import argparse
+import asyncio
+import time
+
+import httpx
+
+# Hammers one wallet with concurrent purchases against a running server and
+# checks the final balance. The user needs a wallet and the item must exist.
+#
+#   python perf-test/bench_wallet_debit.py --item-id 1 --requests 2000 --concurrency 100
+
+
+async def login(client, username, password) -> dict:
+    response = await client.post("/token", data=dict(username=username, password=password))
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+async def main(args):
+    async with httpx.AsyncClient(base_url=args.host, timeout=60) as client:
+        headers = await login(client, args.username, args.password)
+
+        item = (await client.get(f"/items/{args.item_id}")).json()
+        start_balance = (await client.get("/wallets/me", headers=headers)).json()["balance"]
+
+        statuses = {}
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def purchase():
+            async with semaphore:
+                response = await client.post(
+                    "/transactions",
+                    json=dict(item_id=args.item_id, merchant_id=item["merchant_id"]),
+                    headers=headers,
+                )
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*[purchase() for _ in range(args.requests)])
+        elapsed = time.perf_counter() - started
+
+        end_balance = (await client.get("/wallets/me", headers=headers)).json()["balance"]
+
+    succeeded = statuses.get(200, 0)
+    expected = start_balance - succeeded * item["price"]
+
+    print(f"requests:      {args.requests} ({args.concurrency} concurrent)")
+    print(f"status codes:  {statuses}")
+    print(f"throughput:    {args.requests / elapsed:.1f} req/s")
+    print(f"balance:       {start_balance} -> {end_balance} (expected {expected})")
+
+    assert end_balance >= 0, "wallet was overdrawn"
+    assert abs(end_balance - expected) < 1e-6, "lost or duplicated debits"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="http://localhost:8000")
+    parser.add_argument("--username", default="user1")
+    parser.add_argument("--password", default="123456")
+    parser.add_argument("--item-id", type=int, required=True)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,35 @@
+from locust import HttpUser, task, between, constant
+import os
+
+# Run with: locust -f perf-test/login_load.py --headless -u 60 -r 20 -t 1m
+# Compare the p99 of "GET /items" with and without LoginUser in the mix.
+USERNAME = os.environ.get("DIGIMON_USERNAME", "user1")
+PASSWORD = os.environ.get("DIGIMON_PASSWORD", "123456")
+
+
+class LoginUser(HttpUser):
+    wait_time = constant(0)
+    host = "http://localhost:8000"
+    weight = 1
+
+    @task
+    def test_login(self):
+        self.client.post(
+            "/token",
+            data={"username": USERNAME, "password": PASSWORD},
+            name="POST /token",
+        )
+
+
+class ReadUser(HttpUser):
+    wait_time = between(0.1, 0.3)
+    host = "http://localhost:8000"
+    weight = 3
+
+    @task(3)
+    def test_items(self):
+        self.client.get("/items", name="GET /items")
+
+    @task(1)
+    def test_index(self):
+        self.client.get("/", name="GET /")
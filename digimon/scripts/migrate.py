@@ -0,0 +1,9 @@
+import asyncio
+from digimon import config, models
+
+# Brings an existing database up to the current models without dropping
+# data: creates missing tables, columns and indexes.
+if __name__ == "__main__":
+    settings = config.get_settings()
+    models.init_db(settings)
+    asyncio.run(models.upgrade_table())
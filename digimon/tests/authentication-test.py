@@ -0,0 +1,213 @@
+import asyncio
+import threading
+
+from fastapi import HTTPException
+from httpx import AsyncClient
+from digimon import config, deps, hashing, models, security, token_cache
+import pytest
+import pytest_asyncio
+
+
+@pytest_asyncio.fixture(name="stateless_user")
+async def example_stateless_user(session: models.AsyncSession) -> models.DBUser:
+    query = await session.exec(
+        models.select(models.DBUser).where(models.DBUser.username == "stateless")
+    )
+    user = query.one_or_none()
+    if user:
+        return user
+
+    user = models.DBUser(
+        username="stateless",
+        email="stateless@test.com",
+        first_name="Firstname",
+        last_name="Lastname",
+    )
+    await user.set_password("123456")
+    session.add(user)
+    await session.commit()
+    await session.refresh(user)
+    return user
+
+
+async def login(client: AsyncClient, user: models.DBUser) -> dict:
+    response = await client.post(
+        "/token", data={"username": user.username, "password": "123456"}
+    )
+    assert response.status_code == 200
+    return response.json()
+
+
+@pytest.mark.asyncio
+async def test_refresh_token(client: AsyncClient, user1: models.DBUser):
+    tokens = await login(client, user1)
+
+    response = await client.post(
+        "/token/refresh", data={"refresh_token": tokens["refresh_token"]}
+    )
+    data = response.json()
+
+    assert response.status_code == 200
+    assert data["user_id"] == user1.id
+    assert data["refresh_token"] != tokens["refresh_token"]
+
+    headers = {"Authorization": f"Bearer {data['access_token']}"}
+    response = await client.get("/users/me", headers=headers)
+
+    assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_refresh_token_rotation(client: AsyncClient, user1: models.DBUser):
+    tokens = await login(client, user1)
+    payload = {"refresh_token": tokens["refresh_token"]}
+
+    response = await client.post("/token/refresh", data=payload)
+    assert response.status_code == 200
+
+    response = await client.post("/token/refresh", data=payload)
+    assert response.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_refresh_token_used_on_other_worker(
+    client: AsyncClient, user1: models.DBUser, monkeypatch
+):
+    tokens = await login(client, user1)
+    payload = {"refresh_token": tokens["refresh_token"]}
+
+    response = await client.post("/token/refresh", data=payload)
+    assert response.status_code == 200
+
+    # A worker that has not seen the token in memory
+    monkeypatch.setattr(security, "revoked_tokens", security.RevokedTokens())
+    response = await client.post("/token/refresh", data=payload)
+    assert response.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_refresh_token_is_not_access_token(
+    client: AsyncClient, user1: models.DBUser
+):
+    tokens = await login(client, user1)
+
+    headers = {"Authorization": f"Bearer {tokens['refresh_token']}"}
+    response = await client.get("/users/me", headers=headers)
+    assert response.status_code == 401
+
+    payload = {"refresh_token": tokens["access_token"]}
+    response = await client.post("/token/refresh", data=payload)
+    assert response.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_stateless_token_revoked_by_other_worker(
+    client: AsyncClient,
+    session: models.AsyncSession,
+    stateless_user: models.DBUser,
+    monkeypatch,
+):
+    monkeypatch.setattr(config.get_settings(), "AUTH_STATELESS_TOKENS", True)
+    tokens = await login(client, stateless_user)
+    token = tokens["access_token"]
+
+    principal = await deps.get_current_principal(token, session)
+    assert principal.id == stateless_user.id
+    assert principal.token_version == stateless_user.token_version
+
+    # A password change handled by another worker only moves the row
+    stateless_user.token_version += 1
+    session.add(stateless_user)
+    await session.commit()
+
+    # Until AUTH_CACHE_TTL_SECONDS pass this worker trusts its last read
+    principal = await deps.get_current_principal(token, session)
+    assert principal.id == stateless_user.id
+
+    monkeypatch.setattr(config.get_settings(), "AUTH_CACHE_TTL_SECONDS", 0)
+    with pytest.raises(HTTPException) as error:
+        await deps.get_current_principal(token, session)
+    assert error.value.status_code == 401
+
+    # A worker that never saw the user reads the version first
+    monkeypatch.setattr(config.get_settings(), "AUTH_CACHE_TTL_SECONDS", 60)
+    security.token_versions.clear()
+    security.token_versions_checked.clear()
+    with pytest.raises(HTTPException) as error:
+        await deps.get_current_principal(token, session)
+    assert error.value.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_load_user_records_token_version(
+    client: AsyncClient, session: models.AsyncSession, user1: models.DBUser
+):
+    tokens = await login(client, user1)
+    security.token_versions.clear()
+    token_cache.cache.clear()
+
+    await deps.get_current_user(tokens["access_token"], session)
+    assert security.token_versions[user1.id] == user1.token_version
+
+
+# A hasher with one bcrypt thread and room for one waiting check, whose
+# checks block until `release` is set
+def blocked_hasher(monkeypatch) -> tuple[hashing.PasswordHasher, threading.Event]:
+    release = threading.Event()
+
+    def check_password(plain_password: str, hashed_password: str) -> bool:
+        release.wait(5)
+        return True
+
+    monkeypatch.setattr(hashing, "check_password", check_password)
+    return hashing.PasswordHasher(max_workers=1, max_queue=1), release
+
+
+async def wait_for(condition):
+    for _ in range(100):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("condition not reached")
+
+
+@pytest.mark.asyncio
+async def test_password_hasher_queue_depth(monkeypatch):
+    hasher, release = blocked_hasher(monkeypatch)
+
+    running = asyncio.create_task(hasher.verify_password("123456", "hash"))
+    await wait_for(lambda: hasher.running == 1)
+    waiting = asyncio.create_task(hasher.verify_password("123456", "hash"))
+    await wait_for(lambda: hasher.queue_depth == 1)
+
+    with pytest.raises(HTTPException) as error:
+        await hasher.verify_password("123456", "hash")
+    assert error.value.status_code == 503
+
+    release.set()
+    assert await asyncio.gather(running, waiting) == [True, True]
+    assert hasher.queue_depth == 0
+    assert hasher.running == 0
+    hasher.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_login_busy_hasher(
+    client: AsyncClient, user1: models.DBUser, monkeypatch
+):
+    hasher, release = blocked_hasher(monkeypatch)
+    monkeypatch.setattr(hashing, "hasher", hasher)
+
+    running = asyncio.create_task(hasher.verify_password("123456", "hash"))
+    waiting = asyncio.create_task(hasher.verify_password("123456", "hash"))
+    await wait_for(lambda: hasher.queue_depth == 1)
+
+    response = await client.post(
+        "/token", data={"username": user1.username, "password": "123456"}
+    )
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+
+    release.set()
+    await asyncio.gather(running, waiting)
+    hasher.shutdown()
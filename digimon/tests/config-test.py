@@ -51,10 +51,7 @@ async def get_session() -> models.AsyncIterator[models.AsyncSession]:
     settings = SettingsTesting()
     models.init_db(settings)
 
-    async_session = models.sessionmaker(
-        models.engine, class_=models.AsyncSession, expire_on_commit=False
-    )
-    async with async_session() as session:
+    async with models.async_session() as session:
         yield session
 
 
@@ -221,20 +218,16 @@ async def example_merchant1(
     await session.refresh(merchant)
     return merchant
 
-import pytest
-from httpx import AsyncClient
-from datetime import datetime
-from digimon import models
-
 @pytest_asyncio.fixture(name="transaction1")
 async def example_transaction(
-    session: models.AsyncSession, user1: models.DBUser, item1: models.DBItem
+    session: models.AsyncSession, user1: models.DBUser, item_user1: models.DBItem
 ) -> models.DBTransaction:
     transaction = models.DBTransaction(
         amount=100,
-        item_id=item1.id,
+        item_id=item_user1.id,
+        merchant_id=item_user1.merchant_id,
         user_id=user1.id,
-        transaction_date=datetime.utcnow()
+        transaction_date=datetime.datetime.now(tz=datetime.timezone.utc),
     )
 
     session.add(transaction)
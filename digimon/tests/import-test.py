@@ -0,0 +1,54 @@
+import os
+import pathlib
+import subprocess
+import sys
+
+import pytest
+
+ROOT = pathlib.Path(__file__).parent.parent
+
+# Cold import time of each entry point in seconds, measured with
+# python -X importtime, and packages it must leave for later. About twice
+# what a laptop takes, scaled by IMPORT_BUDGET_SCALE on slower machines.
+IMPORT_BUDGETS = {
+    "digimon.config": (0.5, ["fastapi", "sqlalchemy", "uvicorn"]),
+    "digimon.models": (1.5, ["fastapi", "uvicorn", "redis"]),
+    "digimon.run": (0.5, ["fastapi", "sqlalchemy", "uvicorn"]),
+    "digimon.main": (3.0, ["uvicorn", "redis", "gevent", "gunicorn"]),
+}
+
+
+def import_times(module: str, tmp_path: pathlib.Path) -> dict[str, float]:
+    # No SQLDB_URL and no .env: nothing may build Settings at import
+    env = {
+        key: value for key, value in os.environ.items() if key != "SQLDB_URL"
+    }
+    env["PYTHONPATH"] = str(ROOT)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=tmp_path,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stderr
+
+    # import time: self [us] | cumulative | imported package
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        times[name.strip()] = int(cumulative) / 1_000_000
+    return times
+
+
+@pytest.mark.parametrize("module", IMPORT_BUDGETS)
+def test_import_time(module: str, tmp_path: pathlib.Path):
+    budget, deferred = IMPORT_BUDGETS[module]
+    budget *= float(os.environ.get("IMPORT_BUDGET_SCALE", 1))
+
+    times = import_times(module, tmp_path)
+    assert times[module] <= budget, f"{module} took {times[module]:.2f}s"
+    for package in deferred:
+        assert package not in times, f"{module} imports {package}"
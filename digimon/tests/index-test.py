@@ -0,0 +1,77 @@
+import json
+
+from fastapi import FastAPI
+from sqlalchemy import or_, text
+from digimon import models
+import pytest
+
+# The queries behind /token, the wallet routes and the list endpoints. Each
+# one has to be answered from an index, not a scan of the whole table.
+HOT_QUERIES = {
+    "users_by_username": models.select(models.DBUser).where(
+        models.DBUser.username == "user1"
+    ),
+    "users_by_email": models.select(models.DBUser).where(
+        models.DBUser.email == "test@test.com"
+    ),
+    "login": models.select(models.DBUser.id, models.DBUser.password).where(
+        or_(
+            models.DBUser.username == "user1",
+            models.DBUser.email == "user1",
+        )
+    ),
+    "wallet_by_user": models.select(models.DBWallet).where(
+        models.DBWallet.user_id == 1
+    ),
+    "merchants_by_user": models.select(models.DBMerchant).where(
+        models.DBMerchant.user_id == 1
+    ),
+    "items_by_merchant": models.select(models.DBItem).where(
+        models.DBItem.merchant_id == 1
+    ),
+    "items_by_user": models.select(models.DBItem).where(
+        models.DBItem.user_id == 1
+    ),
+    "transactions_by_user": models.select(models.DBTransaction).where(
+        models.DBTransaction.user_id == 1
+    ),
+    "transactions_by_merchant": models.select(models.DBTransaction).where(
+        models.DBTransaction.merchant_id == 1
+    ),
+    "transactions_by_item": models.select(models.DBTransaction).where(
+        models.DBTransaction.item_id == 1
+    ),
+    "transactions_page": models.select(models.DBTransaction)
+    .order_by(models.DBTransaction.transaction_date, models.DBTransaction.id)
+    .limit(50),
+}
+
+
+async def has_sequential_scan(session: models.AsyncSession, query) -> bool:
+    connection = await session.connection()
+    dialect = connection.dialect
+    sql = str(query.compile(dialect=dialect, compile_kwargs={"literal_binds": True}))
+
+    if dialect.name == "postgresql":
+        # Small test tables are cheaper to scan, make the planner show
+        # whether an index could be used at all
+        await connection.execute(text("SET LOCAL enable_seqscan = off"))
+        result = await connection.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"))
+        return "Seq Scan" in json.dumps(result.scalar())
+
+    result = await connection.execute(text(f"EXPLAIN QUERY PLAN {sql}"))
+    return any(
+        row[-1].startswith("SCAN ") and " USING " not in row[-1] for row in result
+    )
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("name", HOT_QUERIES)
+async def test_hot_query_uses_index(
+    app: FastAPI, session: models.AsyncSession, name: str
+):
+    query = HOT_QUERIES[name]
+    try:
+        assert not await has_sequential_scan(session, query), str(query)
+    finally:
+        await session.rollback()
@@ -1,6 +1,10 @@
+import math
 from httpx import AsyncClient
-from digimon import models
+from digimon import cache, config, counts, models, query_stats, security
+from digimon.routers import items
 import pytest
+import pytest_asyncio
+from sqlmodel import func, select
 
 @pytest.mark.asyncio
 async def test_no_permission_create_item(
@@ -52,6 +56,18 @@ async def test_get_item(client: AsyncClient, item_user1: models.DBItem, token_us
     assert data["id"] == item_user1.id
     assert data["name"] == item_user1.name
 
+@pytest.mark.asyncio
+async def test_get_item_not_modified(client: AsyncClient, item_user1: models.DBItem):
+    response = await client.get(f"/items/{item_user1.id}")
+    etag = response.headers["etag"]
+
+    response = await client.get(
+        f"/items/{item_user1.id}", headers={"If-None-Match": etag}
+    )
+
+    assert response.status_code == 304
+    assert response.content == b""
+
 @pytest.mark.asyncio
 async def test_update_item(client: AsyncClient, token_user1: models.Token):
     item_id = 1
@@ -93,3 +109,341 @@ async def test_delete_item(
     # Verify item is deleted
     response = await client.get(f"/items/{item_user1.id}", headers=headers)
     assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_list_items_with_cursor(client: AsyncClient, item_user1: models.DBItem):
+    response = await client.get("/items")
+    data = response.json()
+
+    assert response.status_code == 200
+    assert data["page"] == 1
+
+    cursor = data["next_cursor"]
+    seen = [item["id"] for item in data["items"]]
+    while cursor:
+        response = await client.get("/items", params={"cursor": cursor})
+        data = response.json()
+        assert response.status_code == 200
+        seen.extend(item["id"] for item in data["items"])
+        cursor = data["next_cursor"]
+
+    assert seen == sorted(set(seen))
+    assert item_user1.id in seen
+
+
+@pytest.mark.asyncio
+async def test_list_items_not_modified(
+    client: AsyncClient, item_user1: models.DBItem, monkeypatch
+):
+    # A shared backend, e.g. redis, that saw the last write at this time
+    async def get_version(table: str) -> int:
+        return 1_700_000_000_000_000
+
+    monkeypatch.setattr(cache.backend, "get_version", get_version)
+    response = await client.get("/items")
+    etag = response.headers["etag"]
+
+    response = await client.get("/items", headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert response.content == b""
+
+
+@pytest.mark.asyncio
+async def test_list_items_invalid_cursor(client: AsyncClient):
+    response = await client.get("/items", params={"cursor": "not-a-cursor"})
+
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_list_items_query_count(client: AsyncClient):
+    # The page and, unless cached, the count. Never a query per item.
+    with query_stats.assert_max_queries(models.engine, 2):
+        response = await client.get("/items")
+    assert response.status_code == 200
+
+
+async def bulk_import(
+    client: AsyncClient,
+    session: models.AsyncSession,
+    token_user1: models.Token,
+    merchant1: models.DBMerchant,
+):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    payload = [
+        {
+            "name": f"bulk-{i}",
+            "description": "Bulk imported",
+            "price": 1.0 + i,
+            "merchant_id": merchant1.id if i != 2 else 999_999,
+            "user_id": token_user1.user_id,
+        }
+        for i in range(5)
+    ]
+    response = await client.post("/items/bulk", json=payload, headers=headers)
+
+    assert response.status_code == 200
+    data = response.json()
+    assert (data["created"], data["updated"], data["failed"]) == (4, 0, 1)
+    assert [result["index"] for result in data["results"]] == list(range(5))
+    assert data["results"][2]["detail"] == "Merchant not found"
+
+    # Each returned id is the row that was sent at that index
+    for result in data["results"]:
+        if result["status"] != "created":
+            continue
+        item = await session.get(models.DBItem, result["id"])
+        assert item.name == payload[result["index"]]["name"]
+        assert item.price == payload[result["index"]]["price"]
+
+
+def spy_copy_items(monkeypatch) -> list:
+    calls = []
+    copy_items = items.copy_items
+
+    async def spy(session, rows):
+        calls.append(len(rows))
+        return await copy_items(session, rows)
+
+    monkeypatch.setattr(items, "copy_items", spy)
+    return calls
+
+
+@pytest.mark.asyncio
+async def test_bulk_import_items_copy_error(
+    client: AsyncClient,
+    session: models.AsyncSession,
+    token_user1: models.Token,
+    merchant1: models.DBMerchant,
+):
+    if models.engine.dialect.name != "postgresql":
+        pytest.skip("COPY needs PostgreSQL")
+
+    # PostgreSQL text cannot hold a NUL byte, asyncpg fails the COPY
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    payload = [
+        {"name": "copy-ok", "merchant_id": merchant1.id},
+        {"name": "copy-\x00", "merchant_id": merchant1.id},
+    ]
+    response = await client.post("/items/bulk", json=payload, headers=headers)
+
+    assert response.status_code == 200
+    data = response.json()
+    assert (data["created"], data["failed"]) == (0, 2)
+    assert all(result["detail"] for result in data["results"])
+
+    result = await session.exec(
+        select(func.count())
+        .select_from(models.DBItem)
+        .where(models.DBItem.name == "copy-ok")
+    )
+    assert result.one() == 0
+
+
+@pytest.mark.asyncio
+async def test_bulk_import_items_copy(
+    client: AsyncClient,
+    session: models.AsyncSession,
+    token_user1: models.Token,
+    merchant1: models.DBMerchant,
+    monkeypatch,
+):
+    if models.engine.dialect.name != "postgresql":
+        pytest.skip("COPY needs PostgreSQL")
+
+    calls = spy_copy_items(monkeypatch)
+    await bulk_import(client, session, token_user1, merchant1)
+    assert calls == [4]
+
+
+@pytest.mark.asyncio
+async def test_bulk_import_items_insert(
+    client: AsyncClient,
+    session: models.AsyncSession,
+    token_user1: models.Token,
+    merchant1: models.DBMerchant,
+    monkeypatch,
+):
+    if models.engine.dialect.name == "postgresql":
+        pytest.skip("PostgreSQL uses COPY")
+
+    calls = spy_copy_items(monkeypatch)
+    await bulk_import(client, session, token_user1, merchant1)
+    assert calls == []
+
+
+@pytest.mark.asyncio
+async def test_list_items_no_validators_per_worker(
+    client: AsyncClient, item_user1: models.DBItem
+):
+    # The memory backend cannot see writes made by other workers
+    response = await client.get("/items")
+
+    assert response.status_code == 200
+    assert "etag" not in response.headers
+    assert "last-modified" not in response.headers
+    assert response.headers["cache-control"] == "public, no-cache"
+
+
+async def exact_item_count(session: models.AsyncSession) -> int:
+    result = await session.exec(
+        select(func.count()).select_from(models.DBItem)
+    )
+    return result.one()
+
+
+@pytest.mark.asyncio
+async def test_item_count_cached_until_ttl(
+    session: models.AsyncSession, item_user1: models.DBItem, monkeypatch
+):
+    now = 1000.0
+    monkeypatch.setattr(counts.time, "monotonic", lambda: now)
+    provider = counts.CountProvider(ttl=30)
+    total = await exact_item_count(session)
+
+    assert await provider.count(session, models.DBItem) == total
+
+    # A stale entry is returned until it expires, then counted again
+    provider._counts["items"] = (total + 7, now + 30)
+    assert await provider.count(session, models.DBItem) == total + 7
+    now += 30
+    assert await provider.count(session, models.DBItem) == total
+
+
+@pytest.mark.asyncio
+async def test_item_count_add_and_invalidate(
+    session: models.AsyncSession, item_user1: models.DBItem
+):
+    provider = counts.CountProvider(ttl=3600)
+    total = await provider.count(session, models.DBItem)
+
+    provider.add(models.DBItem, 3)
+    assert await provider.count(session, models.DBItem) == total + 3
+    provider.add(models.DBItem, -(total + 10))
+    assert await provider.count(session, models.DBItem) == 0
+
+    provider.invalidate(models.DBItem)
+    assert await provider.count(session, models.DBItem) == total
+
+    # Nothing is cached for a table that was never counted
+    provider.invalidate()
+    provider.add(models.DBItem, 1)
+    assert await provider.count(session, models.DBItem) == total
+
+
+@pytest.mark.asyncio
+async def test_list_items_exact_count_skips_cache(
+    client: AsyncClient,
+    session: models.AsyncSession,
+    item_user1: models.DBItem,
+    monkeypatch,
+):
+    provider = counts.CountProvider(ttl=3600)
+    provider._counts["items"] = (100 * items.SIZE_PER_PAGE, float("inf"))
+    monkeypatch.setattr(counts, "provider", provider)
+    total = await exact_item_count(session)
+
+    response = await client.get("/items")
+    assert response.json()["page_count"] == 100
+
+    response = await client.get("/items", params={"exact_count": "true"})
+    assert response.json()["page_count"] == math.ceil(total / items.SIZE_PER_PAGE)
+
+
+@pytest_asyncio.fixture(name="seller")
+async def example_seller(session: models.AsyncSession) -> models.DBUser:
+    result = await session.exec(
+        select(models.DBUser).where(models.DBUser.username == "seller")
+    )
+    user = result.one_or_none()
+    if user:
+        return user
+
+    user = models.DBUser(
+        username="seller",
+        email="seller@test.com",
+        first_name="Firstname",
+        last_name="Lastname",
+    )
+    await user.set_password("123456")
+    session.add(user)
+    await session.commit()
+    await session.refresh(user)
+    return user
+
+
+@pytest_asyncio.fixture(name="seller_merchant")
+async def example_seller_merchant(
+    session: models.AsyncSession, seller: models.DBUser
+) -> models.DBMerchant:
+    merchant = models.DBMerchant(
+        name="seller merchant",
+        description="Merchant Description",
+        tax_id="0000000000000",
+        user_id=seller.id,
+    )
+    session.add(merchant)
+    await session.commit()
+    await session.refresh(merchant)
+    return merchant
+
+
+@pytest.mark.asyncio
+async def test_bulk_import_items_other_merchant(
+    client: AsyncClient,
+    session: models.AsyncSession,
+    seller: models.DBUser,
+    seller_merchant: models.DBMerchant,
+    user1: models.DBUser,
+    merchant1: models.DBMerchant,
+    item_user1: models.DBItem,
+):
+    token = security.create_access_token(data={"sub": str(seller.id)})
+    headers = {"Authorization": f"Bearer {token}"}
+    payload = [
+        {"name": "own", "merchant_id": seller_merchant.id, "user_id": user1.id},
+        {"name": "other", "merchant_id": merchant1.id},
+        {"id": item_user1.id, "name": "moved", "merchant_id": seller_merchant.id},
+    ]
+    response = await client.post("/items/bulk", json=payload, headers=headers)
+
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert results[0]["status"] == "created"
+    assert [result["detail"] for result in results[1:]] == [
+        "Not allowed for this merchant",
+        "Not allowed for this merchant",
+    ]
+
+    # The owner is the caller, not the user_id sent in the row
+    item = await session.get(models.DBItem, results[0]["id"])
+    assert item.user_id == seller.id
+
+    await session.refresh(item_user1)
+    assert item_user1.name != "moved"
+
+
+@pytest.mark.asyncio
+async def test_memory_cache_other_worker_not_stale(monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now)
+    settings = config.Settings(CACHE_BACKEND="memory")
+    monkeypatch.setattr(cache, "backend", None)
+    cache.init_cache(settings)
+    worker1 = cache.backend
+    cache.init_cache(settings)
+    worker2 = cache.backend
+
+    for worker in (worker1, worker2):
+        await worker.set("items:1", b'{"price": 10.0}')
+
+    # The update goes through worker1, which deletes only its own copy
+    await worker1.delete("items:1")
+    assert await worker1.get("items:1") is None
+
+    # worker2 reads the row again once the short memory TTL has passed
+    assert settings.CACHE_MEMORY_TTL_SECONDS <= 5
+    now += settings.CACHE_MEMORY_TTL_SECONDS
+    assert await worker2.get("items:1") is None
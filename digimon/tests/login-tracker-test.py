@@ -0,0 +1,62 @@
+import asyncio
+import datetime
+
+import pytest
+from fastapi import FastAPI
+
+from digimon import login_tracker, models
+
+
+def spy_write_logins(monkeypatch, delay: float = 0):
+    calls = []
+    started = asyncio.Event()
+    write_logins = login_tracker.write_logins
+
+    async def spy(session, rows):
+        started.set()
+        await asyncio.sleep(delay)
+        await write_logins(session, rows)
+        calls.append(rows)
+
+    monkeypatch.setattr(login_tracker, "write_logins", spy)
+    return calls, started
+
+
+@pytest.mark.asyncio
+async def test_logins_written_in_one_batch(
+    monkeypatch, app: FastAPI, session: models.AsyncSession, user1: models.DBUser
+):
+    calls, _ = spy_write_logins(monkeypatch)
+    tracker = login_tracker.LoginTracker(interval=60)
+
+    first = datetime.datetime(2024, 1, 1, 8, 0)
+    last = datetime.datetime(2024, 1, 1, 9, 0)
+    tracker.record(user1.id, first)
+    tracker.record(user1.id, last)
+    await tracker.flush()
+
+    assert calls == [[(user1.id, last)]]
+    await session.refresh(user1)
+    assert user1.last_login_date == last
+
+    await tracker.flush()
+    assert len(calls) == 1
+    await tracker.stop()
+
+
+@pytest.mark.asyncio
+async def test_stop_waits_for_flush_in_progress(
+    monkeypatch, app: FastAPI, session: models.AsyncSession, user1: models.DBUser
+):
+    calls, started = spy_write_logins(monkeypatch, delay=0.2)
+    # A full buffer wakes the background task at once
+    tracker = login_tracker.LoginTracker(interval=60, max_size=1)
+
+    last = datetime.datetime(2024, 2, 1, 8, 0)
+    tracker.record(user1.id, last)
+    await asyncio.wait_for(started.wait(), 1)
+    await tracker.stop()
+
+    assert calls == [[(user1.id, last)]]
+    await session.refresh(user1)
+    assert user1.last_login_date == last
@@ -70,3 +70,19 @@ async def test_list_merchants(client: AsyncClient, merchant_user1: models.DBMerc
 
     assert check_merchant["id"] == merchant_user1.id
     assert check_merchant["name"] == merchant_user1.name
+
+@pytest.mark.asyncio
+async def test_list_merchants_filter(client: AsyncClient, merchant_user1: models.DBMerchant):
+    response = await client.get(
+        "/merchants",
+        params={"user_id": merchant_user1.user_id, "name": merchant_user1.name[:3]},
+    )
+
+    data = response.json()
+    assert response.status_code == 200
+    assert data["page"] == 1
+    assert data["size_per_page"] >= len(data["merchants"])
+
+    for merchant in data["merchants"]:
+        assert merchant["user_id"] == merchant_user1.user_id
+        assert merchant["name"].startswith(merchant_user1.name[:3])
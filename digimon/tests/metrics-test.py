@@ -0,0 +1,50 @@
+from fastapi import FastAPI
+from httpx import AsyncClient, ASGITransport
+from digimon import config, metrics
+import pytest
+
+
+def metrics_app(enabled: bool) -> FastAPI:
+    settings = config.Settings(SQLDB_URL="sqlite+aiosqlite://", METRICS_ENABLED=enabled)
+    app = FastAPI()
+
+    @app.get("/items/{item_id}")
+    async def read_item(item_id: int) -> dict:
+        return dict(id=item_id)
+
+    metrics.init_metrics(app, settings)
+    return app
+
+
+@pytest.mark.asyncio
+async def test_metrics_route_latency():
+    app = metrics_app(enabled=True)
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://localhost"
+    ) as client:
+        for item_id in range(3):
+            response = await client.get(f"/items/{item_id}")
+            assert response.status_code == 200
+
+        response = await client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == metrics.CONTENT_TYPE
+    # One series for the route template, not one per id
+    assert (
+        'digimon_http_request_duration_seconds_count{method="GET",'
+        'route="/items/{item_id}",status="200"} 3'
+    ) in response.text
+    assert "digimon_http_requests_in_flight 1" in response.text
+
+
+@pytest.mark.asyncio
+async def test_metrics_disabled():
+    app = metrics_app(enabled=False)
+    assert app.user_middleware == []
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://localhost"
+    ) as client:
+        response = await client.get("/metrics")
+    assert response.status_code == 404
@@ -0,0 +1,37 @@
+import logging
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from digimon import models
+
+
+@pytest.mark.asyncio
+async def test_warm_up_pool_survives_failed_connect(monkeypatch, tmp_path, caplog):
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{tmp_path}/warm-up.db",
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=3,
+    )
+    calls = 0
+
+    # The second of the three connects fails, as during a brief outage
+    @event.listens_for(engine.sync_engine, "do_connect")
+    def flaky_connect(dialect, conn_rec, cargs, cparams):
+        nonlocal calls
+        calls += 1
+        if calls == 2:
+            raise OSError("connection refused")
+
+    monkeypatch.setattr(models, "engine", engine)
+
+    with caplog.at_level(logging.WARNING, logger="digimon.models"):
+        await models.warm_up_pool()
+
+    assert calls == 3
+    assert engine.pool.checkedout() == 0
+    assert engine.pool.checkedin() == 2
+    assert "opened 2 of 3 connections" in caplog.text
+    await engine.dispose()
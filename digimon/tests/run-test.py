@@ -0,0 +1,35 @@
+import os
+
+import pytest
+
+from digimon import config, run
+
+
+@pytest.mark.parametrize("server", ["gunicorn", "uvicorn"])
+def test_serve_applies_connection_budget(monkeypatch, server: str):
+    # Read before serve like the cli does, so it is the cached instance
+    monkeypatch.setattr(config, "settings", None)
+    settings = config.get_settings()
+    settings.DB_CONNECTION_BUDGET = 12
+    settings.WEB_WORKERS = 3
+    settings.WEB_SERVER = server
+    monkeypatch.setenv("DB_POOL_SIZE", "10")
+    monkeypatch.setenv("DB_MAX_OVERFLOW", "10")
+
+    # gunicorn workers build the app from the settings object, spawned
+    # uvicorn workers from the environment
+    seen = []
+
+    def run_server(settings, workers: int):
+        if server == "gunicorn":
+            seen.append((settings.DB_POOL_SIZE, settings.DB_MAX_OVERFLOW))
+        else:
+            worker_settings = config.Settings()
+            seen.append((worker_settings.DB_POOL_SIZE, worker_settings.DB_MAX_OVERFLOW))
+
+    monkeypatch.setattr(run, f"run_{server}", run_server)
+    run.serve(settings)
+
+    assert seen == [(2, 2)]
+    assert config.get_settings().DB_POOL_SIZE == 2
+    assert os.environ["DB_POOL_SIZE"] == "2"
@@ -1,8 +1,13 @@
+import csv
+import io
+import json
 import pytest
 import pytest_asyncio
 from httpx import AsyncClient
 from datetime import datetime
-from digimon import models
+from digimon import models, security
+from digimon.routers import transaction
+from sqlmodel import func
 
 @pytest_asyncio.fixture(name="transaction1")
 async def example_transaction(
@@ -11,6 +16,7 @@ async def example_transaction(
     transaction = models.DBTransaction(
         amount=100,
         item_id=item1.id,
+        merchant_id=item1.merchant_id,
         user_id=user1.id,
         transaction_date=datetime.utcnow()
     )
@@ -49,28 +55,6 @@ async def example_merchant(session: models.AsyncSession, user1: models.DBUser) -
     await session.refresh(merchant)
     return merchant
 
-@pytest_asyncio.fixture(name="user1")
-async def example_user(session: models.AsyncSession) -> models.DBUser:
-    user = models.DBUser(
-        username="testuser",
-        email="testuser@example.com",
-        hashed_password="hashedpassword"  # You should use a proper hashed password in real scenarios
-    )
-
-    session.add(user)
-    await session.commit()
-    await session.refresh(user)
-    return user
-
-@pytest_asyncio.fixture(name="token_user1")
-async def example_token(user1: models.DBUser) -> models.Token:
-    # Generate a fake token for testing
-    return models.Token(
-        access_token="test-access-token",
-        token_type="Bearer",
-        user_id=user1.id
-    )
-
 # Test cases
 
 @pytest.mark.asyncio
@@ -143,4 +127,232 @@ async def test_delete_transaction(
     print("Response JSON:", response.json())
 
     assert response.status_code == 200
-    assert response.json() == {"message": "delete success"}
\ No newline at end of file
+    assert response.json() == {"message": "delete success"}
+
+@pytest_asyncio.fixture(name="other_item")
+async def example_other_item(
+    session: models.AsyncSession, user1: models.DBUser
+) -> models.DBItem:
+    merchant = models.DBMerchant(
+        name="Other Merchant",
+        description="Another merchant",
+        tax_id="3210987654321",
+        user_id=user1.id,
+    )
+    session.add(merchant)
+    await session.commit()
+
+    item = models.DBItem(
+        name="Other Item",
+        description="Sold by another merchant",
+        price=5.0,
+        merchant_id=merchant.id,
+        user_id=user1.id,
+    )
+    session.add(item)
+    await session.commit()
+    await session.refresh(item)
+    return item
+
+
+# A user of its own, so the wallet does not change what wallet-test expects
+@pytest_asyncio.fixture(name="buyer_wallet")
+async def example_buyer_wallet(session: models.AsyncSession) -> models.DBWallet:
+    query = await session.exec(
+        models.select(models.DBUser).where(models.DBUser.username == "buyer")
+    )
+    buyer = query.one_or_none()
+    if buyer is None:
+        buyer = models.DBUser(
+            username="buyer",
+            email="buyer@test.com",
+            first_name="Firstname",
+            last_name="Lastname",
+        )
+        await buyer.set_password("123456")
+        session.add(buyer)
+        await session.commit()
+        await session.refresh(buyer)
+
+    query = await session.exec(
+        models.select(models.DBWallet).where(models.DBWallet.user_id == buyer.id)
+    )
+    wallet = query.one_or_none()
+    if wallet is None:
+        wallet = models.DBWallet(balance=1000.0, user_id=buyer.id)
+        session.add(wallet)
+        await session.commit()
+    await session.refresh(wallet)
+    return wallet
+
+
+def buyer_headers(wallet: models.DBWallet) -> dict:
+    token = security.create_access_token(data={"sub": str(wallet.user_id)})
+    return {"Authorization": f"Bearer {token}"}
+
+
+async def count_transactions(session: models.AsyncSession) -> int:
+    result = await session.exec(
+        models.select(func.count()).select_from(models.DBTransaction)
+    )
+    return result.one()
+
+
+@pytest.mark.asyncio
+async def test_create_transactions_batch(
+    client: AsyncClient,
+    session: models.AsyncSession,
+    item1: models.DBItem,
+    other_item: models.DBItem,
+    buyer_wallet: models.DBWallet,
+):
+    headers = buyer_headers(buyer_wallet)
+    await session.refresh(buyer_wallet)
+    balance = buyer_wallet.balance
+
+    payload = [
+        {"amount": 1, "item_id": item1.id, "merchant_id": None},
+        {"amount": 2, "item_id": other_item.id, "merchant_id": None},
+        {"amount": 3, "item_id": item1.id, "merchant_id": None},
+    ]
+    response = await client.post("/transactions/batch", json=payload, headers=headers)
+
+    assert response.status_code == 200
+    data = response.json()
+
+    # One row per input, in input order, with the merchant of each item
+    assert [(row["item_id"], row["amount"]) for row in data] == [
+        (row["item_id"], row["amount"]) for row in payload
+    ]
+    assert [row["merchant_id"] for row in data] == [
+        item1.merchant_id,
+        other_item.merchant_id,
+        item1.merchant_id,
+    ]
+    assert all(row["user_id"] == buyer_wallet.user_id for row in data)
+
+    # The returned ids are the stored rows, assigned in input order
+    ids = [row["id"] for row in data]
+    assert ids == sorted(set(ids))
+    for row in data:
+        db_transaction = await session.get(models.DBTransaction, row["id"])
+        assert db_transaction.item_id == row["item_id"]
+        assert db_transaction.amount == row["amount"]
+
+    await session.refresh(buyer_wallet)
+    assert buyer_wallet.balance == balance - 2 * item1.price - other_item.price
+
+
+@pytest.mark.asyncio
+async def test_create_transactions_batch_rolls_back(
+    client: AsyncClient,
+    session: models.AsyncSession,
+    item1: models.DBItem,
+    buyer_wallet: models.DBWallet,
+):
+    headers = buyer_headers(buyer_wallet)
+    await session.refresh(buyer_wallet)
+    balance = buyer_wallet.balance
+    transactions = await count_transactions(session)
+
+    payload = [
+        {"amount": 1, "item_id": item1.id, "merchant_id": None},
+        {"amount": 1, "item_id": 999_999, "merchant_id": None},
+    ]
+    response = await client.post("/transactions/batch", json=payload, headers=headers)
+
+    assert response.status_code == 404
+
+    # Nothing from the batch is stored and the wallet is not debited
+    assert await count_transactions(session) == transactions
+    await session.refresh(buyer_wallet)
+    assert buyer_wallet.balance == balance
+
+
+@pytest_asyncio.fixture(name="finance_user")
+async def example_finance_user(session: models.AsyncSession) -> models.DBUser:
+    query = await session.exec(
+        models.select(models.DBUser).where(models.DBUser.username == "finance")
+    )
+    user = query.one_or_none()
+    if user is None:
+        user = models.DBUser(
+            username="finance",
+            email="finance@test.com",
+            first_name="Firstname",
+            last_name="Lastname",
+            roles=["finance"],
+        )
+        await user.set_password("123456")
+        session.add(user)
+        await session.commit()
+        await session.refresh(user)
+    return user
+
+
+@pytest.mark.asyncio
+async def test_export_transactions_forbidden(
+    client: AsyncClient, token_user1: models.Token
+):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    response = await client.get("/transactions/export", headers=headers)
+
+    assert response.status_code == 403
+
+
+@pytest.mark.asyncio
+async def test_export_transactions(
+    client: AsyncClient,
+    session: models.AsyncSession,
+    finance_user: models.DBUser,
+    item1: models.DBItem,
+    buyer_wallet: models.DBWallet,
+    monkeypatch,
+):
+    token = security.create_access_token(data={"sub": str(finance_user.id)})
+    headers = {"Authorization": f"Bearer {token}"}
+    for amount in (1, 2, 3, 4, 5):
+        session.add(
+            models.DBTransaction(
+                amount=amount,
+                item_id=item1.id,
+                merchant_id=item1.merchant_id,
+                user_id=buyer_wallet.user_id,
+            )
+        )
+    await session.commit()
+
+    result = await session.exec(
+        models.select(models.DBTransaction)
+        .where(models.DBTransaction.user_id == buyer_wallet.user_id)
+        .order_by(models.DBTransaction.transaction_date, models.DBTransaction.id)
+    )
+    expected = result.all()
+    fields = ["id", "amount", "merchant_id", "user_id", "item_id", "transaction_date"]
+
+    # Several server-side cursor batches per export
+    monkeypatch.setattr(transaction, "EXPORT_BATCH_SIZE", 2)
+    params = {"user_id": buyer_wallet.user_id}
+
+    response = await client.get("/transactions/export", params=params, headers=headers)
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert len(rows) == len(expected)
+    assert [list(row) for row in rows] == [fields] * len(expected)
+    assert [row["id"] for row in rows] == [row.id for row in expected]
+    assert [row["amount"] for row in rows] == [row.amount for row in expected]
+
+    response = await client.get(
+        "/transactions/export", params=dict(params, format="csv"), headers=headers
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    header, *rows = csv.reader(io.StringIO(response.text))
+    assert header == fields
+    assert [int(row[0]) for row in rows] == [row.id for row in expected]
+    assert [
+        datetime.fromisoformat(row[5]) for row in rows
+    ] == [row.transaction_date for row in expected]
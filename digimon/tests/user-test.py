@@ -0,0 +1,71 @@
+from httpx import AsyncClient
+from digimon import models
+import pytest
+import pytest_asyncio
+
+
+@pytest_asyncio.fixture(name="user2")
+async def example_user2(session: models.AsyncSession) -> models.DBUser:
+    query = await session.exec(
+        models.select(models.DBUser).where(models.DBUser.username == "user2")
+    )
+    user = query.one_or_none()
+    if user:
+        return user
+
+    user = models.DBUser(
+        username="user2",
+        email="user2@test.com",
+        first_name="Firstname",
+        last_name="Lastname",
+    )
+    await user.set_password("123456")
+    session.add(user)
+    await session.commit()
+    await session.refresh(user)
+    return user
+
+
+@pytest.mark.asyncio
+async def test_update_other_user_forbidden(
+    client: AsyncClient,
+    session: models.AsyncSession,
+    token_user1: models.Token,
+    user2: models.DBUser,
+):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    payload = {
+        "email": "attacker@test.com",
+        "username": "user2",
+        "first_name": "Firstname",
+        "last_name": "Lastname",
+        "roles": [],
+    }
+    response = await client.put(
+        f"/users/{user2.id}/update", json=payload, headers=headers
+    )
+
+    assert response.status_code == 403
+
+    await session.refresh(user2)
+    assert user2.email == "user2@test.com"
+
+
+@pytest.mark.asyncio
+async def test_update_own_user(
+    client: AsyncClient, user1: models.DBUser, token_user1: models.Token
+):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    payload = {
+        "email": user1.email,
+        "username": user1.username,
+        "first_name": "Changed",
+        "last_name": user1.last_name,
+        "roles": user1.roles,
+    }
+    response = await client.put(
+        f"/users/{user1.id}/update", json=payload, headers=headers
+    )
+
+    assert response.status_code == 200
+    assert response.json()["first_name"] == "Changed"
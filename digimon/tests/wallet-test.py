@@ -1,5 +1,6 @@
 from httpx import AsyncClient
 from digimon import models
+import asyncio
 import pytest
 
 @pytest.mark.asyncio
@@ -48,6 +49,42 @@ async def test_add_wallet_balance(
     assert response.status_code == 200
     assert data["balance"] == wallet_user1.balance + payload
 
+@pytest.mark.asyncio
+async def test_add_wallet_balance_concurrent(
+    client: AsyncClient, wallet_user1: models.DBWallet, token_user1: models.Token
+):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    response = await client.get("/wallets/me", headers=headers)
+    start_balance = response.json()["balance"]
+
+    responses = await asyncio.gather(
+        *[client.put("/wallets/balance/10", headers=headers) for _ in range(50)]
+    )
+    assert all(response.status_code == 200 for response in responses)
+
+    response = await client.get("/wallets/me", headers=headers)
+    assert response.json()["balance"] == start_balance + 50 * 10
+
+@pytest.mark.asyncio
+async def test_add_wallet_balance_idempotency_key(
+    client: AsyncClient, wallet_user1: models.DBWallet, token_user1: models.Token
+):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    response = await client.get("/wallets/me", headers=headers)
+    start_balance = response.json()["balance"]
+
+    headers["Idempotency-Key"] = "top-up-1"
+    responses = await asyncio.gather(
+        *[client.put("/wallets/balance/100", headers=headers) for _ in range(5)]
+    )
+    assert all(response.status_code == 200 for response in responses)
+
+    response = await client.get("/wallets/me", headers=headers)
+    assert response.json()["balance"] == start_balance + 100
+
+    response = await client.put("/wallets/balance/1", headers=headers)
+    assert response.status_code == 409
+
 @pytest.mark.asyncio
 async def test_delete_wallet(
     client: AsyncClient, wallet_user1: models.DBWallet, token_user1: models.Token